@@ -0,0 +1,826 @@
+#!/usr/bin/env python
+"""
+The MIT License
+
+Copyright (c) 2015 by The University of Texas MD Anderson Cancer Center
+Wanding Zhou, Tenghui Chen, Ken Chen (kchen3@mdanderson.org)
+
+Permission is hereby granted, free of charge, to any person obtaining
+a copy of this software and associated documentation files (the
+"Software"), to deal in the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+## Regression tests of the database and reference formats and of the
+## execution modes.
+##
+## A small synthetic genome is generated with designed coding
+## sequences, N bases inside coding exons, nested transcripts (inside
+## the intron of another) and overlapping isoforms on both strands.
+## It is indexed in each format (tabix, --sql, --cds-seq, --snv-table,
+## two sources with their merged location index) and read from each
+## kind of reference (FASTA, 2-bit, bgzip).  Every combination, and
+## every execution mode (--mem, --jobs, --pipeline, --sort-window, no
+## transcript cache, no memo) and way of output (-O, --line-buffered),
+## must reproduce the expected outputs in regress/ byte for byte.
+##
+## The in-process api (transvar.api) and the annotation server
+## (transvar serve) must give the same annotations as the command line,
+## and the batch position mappers (posbatch), with or without numpy,
+## the same positions as the one at a time ones.
+##
+## The expected outputs are those of this version; they differ from
+## those of transvar 2.5.1 only in the lines of the fixes listed in
+## span_regions and closest_regions, which are checked on their own.
+##
+## usage: python regress.py [--update] [--keep DIR] [CHECK ...]
+##   --update  rewrite the expected outputs from the serial run
+##   --keep    build in DIR and keep it, for inspection
+##   CHECK     run only these checks (formats, api, server, batch,
+##             fixes), all by default
+##
+## requires bgzip and tabix in the PATH, as transvar index does. The
+## expected outputs are written by python 3; on python 2, whose dicts
+## order the candidates and the spanned genes differently, only the
+## checks against the command line run.
+
+import os, sys, re, shutil, tempfile, argparse, filecmp
+from subprocess import check_call
+
+testdir = os.path.dirname(os.path.abspath(__file__))
+topdir = os.path.dirname(testdir)
+expdir = os.path.join(testdir, 'regress')
+# in place of this directory, whose test.py would shadow the test
+# package future imports on python 2
+sys.path[0] = topdir
+
+##################
+## the fixture
+##################
+
+chrm_lens = [('chr1', 40000), ('chr2', 20000)]
+
+# name, gene, chromosome, strand, exons (0-based, half open),
+# cds begin and end (UCSC refGene convention)
+transcripts = [
+    ('NM_100001', 'GENEX', 'chr1', '+', [(1000,1300),(3000,3400),(9000,9600)], 1100, 9402),
+    # nested in the intron of NM_100001, on the other strand
+    ('NM_100002', 'GENEY', 'chr1', '-', [(4000,4300),(5000,5400),(6000,6300)], 4099, 6200),
+    ('NR_100003', 'GENEW', 'chr1', '+', [(7000,7200),(7500,7700)], 7700, 7700),
+    # isoforms, NM_100005 skips the middle exon and shifts the frame
+    ('NM_100004', 'GENEZ', 'chr1', '+', [(15000,15400),(16000,16500),(18000,18600)], 15200, 18401),
+    ('NM_100005', 'GENEZ', 'chr1', '+', [(15000,15400),(18000,18600)], 15200, 18401),
+    ('NM_100006', 'GENEV', 'chr1', '-', [(25000,25500),(27000,27300)], 25100, 27200),
+    ('NM_100007', 'GENEU', 'chr2', '-', [(2000,2600),(4000,4500),(6000,6400)], 2298, 6200),
+    ('NM_100008', 'GENET', 'chr2', '+', [(10000,11000)], 10100, 10901),
+]
+
+# coding sequences are designed for these, NM_100005 shares the
+# exons of NM_100004
+designed = ['NM_100001', 'NM_100002', 'NM_100004', 'NM_100006', 'NM_100007', 'NM_100008']
+
+# N bases (1-based position, length), inside coding exons
+n_bases = [('chr1', 3201, 1), ('chr1', 15301, 2), ('chr2', 4201, 3), ('chr2', 10501, 1),
+           ('chr1', 1050, 1)]      # 5' UTR
+
+bases = 'ACGT'
+stops = set(['TAA', 'TAG', 'TGA'])
+codon_table = dict(zip(
+    [a+b+c for a in 'TCAG' for b in 'TCAG' for c in 'TCAG'],
+    'FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG'))
+complement = dict(zip('ACGTN', 'TGCAN'))
+
+class Random():
+
+    """ a linear congruential generator, the fixture is the same
+    on every platform and python version """
+
+    def __init__(self, seed):
+        self.x = seed
+
+    def next(self, n):
+        self.x = (self.x * 1103515245 + 12345) & 0x7fffffff
+        return (self.x >> 16) % n
+
+def reverse_complement(s):
+    return ''.join(complement[b] for b in reversed(s))
+
+def cds_segments(exons, cds_beg, cds_end):
+    """ 1-based inclusive coding segments, in genomic order """
+    segs = []
+    for b, e in exons:
+        b = max(b, cds_beg) + 1
+        e = min(e, cds_end)
+        if b <= e:
+            segs.append((b, e))
+    return segs
+
+def make_genome():
+
+    rand = Random(2015)
+    genome = {}
+    for chrm, l in chrm_lens:
+        genome[chrm] = [bases[rand.next(4)] for i in range(l)]
+
+    sense = sorted(c for c in codon_table if c not in stops)
+    for name, gene, chrm, strand, exons, cds_beg, cds_end in transcripts:
+        if name not in designed:
+            continue
+        segs = cds_segments(exons, cds_beg, cds_end)
+        n = sum(e-b+1 for b, e in segs)
+        assert n % 3 == 0
+        cds = 'ATG' + ''.join(sense[rand.next(len(sense))] for i in range(n//3-2)) + 'TAG'
+        if strand == '-':
+            cds = reverse_complement(cds)
+        i = 0
+        for b, e in segs:
+            genome[chrm][b-1:e] = list(cds[i:i+e-b+1])
+            i += e-b+1
+
+    for chrm, pos, l in n_bases:
+        genome[chrm][pos-1:pos-1+l] = ['N']*l
+
+    return dict((chrm, ''.join(s)) for chrm, s in genome.items())
+
+def coding_sequence(genome, t):
+    name, gene, chrm, strand, exons, cds_beg, cds_end = t
+    segs = cds_segments(exons, cds_beg, cds_end)
+    cds = ''.join(genome[chrm][b-1:e] for b, e in segs)
+    gposes = [p for b, e in segs for p in range(b, e+1)]
+    if strand == '-':
+        cds = reverse_complement(cds)
+        gposes.reverse()
+    return cds, gposes
+
+def write_fixture(d, genome):
+
+    # reference, with its faidx index
+    with open(os.path.join(d, 'ref.fa'), 'w') as fa, open(os.path.join(d, 'ref.fa.fai'), 'w') as fai:
+        offset = 0
+        for chrm, l in chrm_lens:
+            header = '>%s\n' % chrm
+            fa.write(header)
+            offset += len(header)
+            fai.write('%s\t%d\t%d\t60\t61\n' % (chrm, l, offset))
+            for i in range(0, l, 60):
+                line = genome[chrm][i:i+60]+'\n'
+                fa.write(line)
+                offset += len(line)
+
+    # UCSC refGene and knownGene tables
+    with open(os.path.join(d, 'refgene.txt'), 'w') as fh:
+        for name, gene, chrm, strand, exons, cds_beg, cds_end in transcripts:
+            fh.write('\t'.join(map(str, [
+                0, name, chrm, strand, exons[0][0], exons[-1][1], cds_beg, cds_end, len(exons),
+                ''.join('%d,' % b for b, e in exons), ''.join('%d,' % e for b, e in exons),
+                0, gene, 'cmpl', 'cmpl', '0,']))+'\n')
+
+    with open(os.path.join(d, 'kg.txt'), 'w') as fh, open(os.path.join(d, 'kg_alias.txt'), 'w') as fh2:
+        for name, gene, chrm, strand, exons, cds_beg, cds_end in transcripts:
+            kgid = 'uc%s.1' % name[3:]
+            fh.write('\t'.join(map(str, [
+                kgid, chrm, strand, exons[0][0], exons[-1][1], cds_beg, cds_end, len(exons),
+                ''.join('%d,' % b for b, e in exons), ''.join('%d,' % e for b, e in exons),
+                '', kgid]))+'\n')
+            fh2.write('%s\t%s\n' % (kgid, gene))
+
+    # aliases of gene names, for --idmap
+    with open(os.path.join(d, 'idmap.txt'), 'w') as fh:
+        for gene in sorted(set(t[1] for t in transcripts)):
+            fh.write('ALIAS%s\t%s\n' % (gene[-1], gene))
+
+def write_queries(d, genome):
+
+    rand = Random(77)
+    gq, cq, pq, csq = [], [], [], []
+    for t in transcripts:
+        name, gene, chrm, strand, exons, cds_beg, cds_end = t
+        if cds_beg == cds_end:
+            continue
+        cds, gposes = coding_sequence(genome, t)
+
+        # SNVs throughout the coding sequence and every SNV around
+        # the N bases
+        near_n = set()
+        for c, pos, l in n_bases:
+            if c == chrm:
+                near_n.update(range(pos-4, pos+l+4))
+        for gpos in sorted(set(gposes[::17]) | (near_n & set(gposes))):
+            ref = genome[chrm][gpos-1]
+            alts = [b for b in bases if b != ref]
+            if gpos not in near_n:
+                alts = [alts[rand.next(len(alts))]]
+            for alt in alts:
+                gq.append('%s:g.%d%s>%s' % (chrm, gpos, ref, alt))
+
+        # splice sites, deletions, insertions and block substitutions
+        for b, e in exons:
+            gq.append('%s:g.%d%s>%s' % (chrm, b, genome[chrm][b-1], 'A' if genome[chrm][b-1] != 'A' else 'C'))
+            gq.append('%s:g.%d_%ddel' % (chrm, e-1, e+2))
+        for i in range(3, len(gposes)-6, 211):
+            g1, g2 = sorted([gposes[i], gposes[i+2]])
+            gq.append('%s:g.%d_%ddel' % (chrm, g1, g2))
+            gq.append('%s:g.%d_%dinsGGT' % (chrm, g1, g1+1))
+            gq.append('%s:g.%ddelinsTT' % (chrm, g1))
+
+        # cDNA
+        for i in range(0, len(cds), 97):
+            cq.append('%s:c.%d' % (name, i+1))
+            cq.append('%s:c.%d%s>%s' % (name, i+1, cds[i], 'G' if cds[i] != 'G' else 'T'))
+            cq.append('%s:c.%ddel' % (name, i+1))
+            cq.append('%s:c.%d_%ddel' % (name, i+1, i+3))
+            cq.append('%s:c.%d_%dinsAC' % (name, i+1, i+2))
+            cq.append('%s:c.%ddup' % (name, i+1))
+        cq.append('%s:c.-20' % name)
+        cq.append('%s:c.*10' % name)
+        cq.append('%s:c.%d+3A>G' % (name, len(cds)//3))
+
+        # protein
+        protein = ''.join(codon_table.get(cds[i:i+3], 'X') for i in range(0, len(cds)-2, 3))
+        for i in range(0, len(protein), 23):
+            aa = protein[i]
+            pq.append('%s:p.%d' % (name, i+1))
+            pq.append('%s:p.%s%d%s' % (name, aa, i+1, 'W' if aa != 'W' else 'C'))
+            pq.append('%s:p.%s%d*' % (name, aa, i+1))
+            pq.append('%s:p.%s%ddel' % (name, aa, i+1))
+            csq.append('%s:p.%s%d%s' % (gene, aa, i+1, 'W' if aa != 'W' else 'C'))
+            if i % 92 == 0:     # frameshifts take a search each
+                pq.append('%s:p.%s%dfs' % (name, aa, i+1))
+                pq.append('%s:p.%s%dfs*5' % (gene, aa, i+1))
+        pq.append('%s:p.%s%d' % (gene, protein[1], 2))
+        cq.append('ALIAS%s:c.%d%s>%s' % (gene[-1], 10, cds[9], 'G' if cds[9] != 'G' else 'T'))
+        pq.append('ALIAS%s:p.%s%d%s' % (gene[-1], protein[2], 3, 'W' if protein[2] != 'W' else 'C'))
+
+    # spans over the nested transcripts and across genes, intergenic
+    # and upstream of the first transcript
+    gq.extend([
+        'chr1:g.3300_9100del', 'chr1:g.3500_8900del', 'chr1:g.4150_6100del',
+        'chr1:g.20500_40000del', 'chr1:g.1050_18100del', 'chr1:g.7100_7600del',
+        'chr1:g.5100_5102del', 'chr1:g.12000A>T', 'chr1:g.500', 'chr1:g.35000',
+        'chr1:g.3201_3203del', 'chr2:g.4200_4204del', 'chr2:g.8000_12000del'])
+
+    for fn, q in [('g.list', gq), ('c.list', cq), ('p.list', pq), ('cs.list', csq)]:
+        with open(os.path.join(d, fn), 'w') as fh:
+            fh.write(''.join(_+'\n' for _ in q))
+
+##################
+## the runs
+##################
+
+class Runner():
+
+    def __init__(self, d):
+        self.d = d
+        self.env = dict(os.environ)
+        self.env['PYTHONPATH'] = os.pathsep.join([topdir] + ([self.env['PYTHONPATH']] if self.env.get('PYTHONPATH') else []))
+        self.env['TRANSVAR_CFG'] = os.path.join(d, 'transvar.cfg')
+        self.env['TRANSVAR_DOWNLOAD_DIR'] = d
+        with open(self.env['TRANSVAR_CFG'], 'w') as fh:
+            fh.write('[DEFAULT]\nrefversion = test\n\n[test]\nreference = %s\n' % os.path.join(d, 'ref.fa'))
+        self.nfailed = 0
+
+    def transvar(self, args, out=None):
+        cmd = [sys.executable, os.path.join(topdir, 'bin', 'transvar')] + args
+        with open(os.devnull, 'w') as devnull:
+            if out is None:
+                check_call(cmd, cwd=self.d, env=self.env, stdout=devnull, stderr=devnull)
+            else:
+                with open(out, 'w') as fh:
+                    check_call(cmd, cwd=self.d, env=self.env, stdout=fh, stderr=devnull)
+
+    def index(self, name, args):
+        """ index the tables into their own directory """
+        dbdir = os.path.join(self.d, name)
+        os.mkdir(dbdir)
+        for fn in ['refgene.txt', 'kg.txt', 'kg_alias.txt']:
+            shutil.copy(os.path.join(self.d, fn), dbdir)
+        self.transvar(['index', '--ucsc', os.path.join(dbdir, 'refgene.txt')] + args)
+        self.transvar(['index', '--kg', os.path.join(dbdir, 'kg.txt'),
+                       '--alias', os.path.join(dbdir, 'kg_alias.txt')] + args)
+
+    def prepare(self):
+
+        genome = make_genome()
+        write_fixture(self.d, genome)
+        write_queries(self.d, genome)
+
+        # a 2-bit copy and a bgzip copy of the reference, each
+        # read in place of the FASTA next to it
+        for name in ['twobit', 'bgzf']:
+            os.mkdir(os.path.join(self.d, name))
+        shutil.copy(os.path.join(self.d, 'ref.fa'), os.path.join(self.d, 'twobit'))
+        shutil.copy(os.path.join(self.d, 'ref.fa.fai'), os.path.join(self.d, 'twobit'))
+        from transvar.faidx import RefGenome
+        from transvar.twobit import write_twobit
+        fa = os.path.join(self.d, 'twobit', 'ref.fa')
+        rg = RefGenome(fa)
+        write_twobit(rg, fa+'.tv2bit')
+        with open(os.path.join(self.d, 'bgzf', 'ref.fa.gz'), 'wb') as fh:
+            check_call(['bgzip', '-c', os.path.join(self.d, 'ref.fa')], stdout=fh)
+        shutil.copy(os.path.join(self.d, 'ref.fa.fai'), os.path.join(self.d, 'bgzf', 'ref.fa.gz.fai'))
+
+        self.transvar(['index', '--idmap', 'idmap.txt', '-o', 'idmap.idx'])
+        self.index('db', [])
+        self.index('dbsql', ['--sql'])
+        # the reference is the configured one, transvar index --reference
+        # would also faidx it
+        self.index('dbseq', ['--sql', '--cds-seq', '--snv-table'])
+
+    def dbargs(self, db, ref, two_sources=False):
+        dbargs = ['--ucsc', os.path.join(self.d, db, 'refgene.txt.transvardb'),
+                  '--reference', os.path.join(self.d, ref),
+                  '--idmap', os.path.join(self.d, 'idmap.idx')]
+        if two_sources:
+            dbargs += ['--kg', os.path.join(self.d, db, 'kg.txt.transvardb')]
+        return dbargs
+
+    def annotate(self, tag, db, ref, args, two_sources=False, ofile=False):
+
+        """ run every query list, write outputs to <tag>/
+        with ofile, the outputs are written by -O and stdout must
+        stay empty """
+        outdir = os.path.join(self.d, tag)
+        os.mkdir(outdir)
+        dbargs = self.dbargs(db, ref, two_sources)
+        for fn, cmd in [
+                ('g.out', ['ganno', '-l', 'g.list']),
+                ('c.out', ['canno', '-l', 'c.list']),
+                ('p.out', ['panno', '-l', 'p.list']),
+                ('g1.out', ['ganno', '-l', 'g.list', '--oneline', '--gseq']),
+                ('p3.out', ['panno', '-l', 'p.list', '--aa3', '--gseq']),
+                ('cs.out', ['codonsearch', '-l', 'cs.list'])]:
+            out = os.path.join(outdir, fn)
+            if ofile:
+                self.transvar(cmd + dbargs + args + ['-O', out], out+'.stdout')
+                if os.path.getsize(out+'.stdout') == 0:
+                    os.remove(out+'.stdout')
+            else:
+                self.transvar(cmd + dbargs + args, out)
+        return outdir
+
+    def update(self, outdir, prefix=''):
+        for fn in os.listdir(outdir):
+            shutil.copy(os.path.join(outdir, fn), os.path.join(expdir, prefix+fn))
+
+    def check(self, tag, outdir, prefix=''):
+
+        """ compare the outputs with the expected ones, named
+        <prefix><output> in regress/ """
+        failed = []
+        for fn in sorted(os.listdir(outdir)):
+            expfn = os.path.join(expdir, prefix+fn)
+            if not (os.path.exists(expfn) and
+                    filecmp.cmp(os.path.join(outdir, fn), expfn, shallow=False)):
+                failed.append(fn)
+        self.report(tag, failed)
+
+    def report(self, tag, failed):
+        if failed:
+            self.nfailed += 1
+            print('[FAIL] %s: %s differ' % (tag, ', '.join(failed)))
+        else:
+            print('[OK] %s' % tag)
+
+    def saturate(self, tag, db, ref, regions):
+
+        """ saturate the regions, the output must agree with ganno
+        over the same SNVs """
+        outdir = os.path.join(self.d, tag)
+        os.mkdir(outdir)
+        dbargs = ['--ucsc', os.path.join(self.d, db, 'refgene.txt.transvardb'),
+                  '--reference', os.path.join(self.d, ref)]
+        satfn = os.path.join(outdir, 'sat.out')
+        with open(satfn, 'w') as fh:
+            for i, region in enumerate(regions):
+                fn = os.path.join(outdir, 'sat%d' % i)
+                self.transvar(['saturate', '-i', region] + (['--noheader'] if i else []) + dbargs, fn)
+                with open(fn) as fh2:
+                    fh.write(fh2.read())
+                os.remove(fn)
+
+        listfn = os.path.join(self.d, 'sat.list')
+        with open(satfn) as fh, open(listfn, 'w') as fh2:
+            last = None
+            for line in fh:
+                q = line.split('\t')[0]
+                if q != 'input' and q != last:
+                    fh2.write(q+'\n')
+                last = q
+        gfn = os.path.join(self.d, 'sat.ganno')
+        self.transvar(['ganno', '-l', listfn] + dbargs, gfn)
+        if filecmp.cmp(satfn, gfn, shallow=False):
+            print('[OK] %s agrees with ganno' % tag)
+        else:
+            self.nfailed += 1
+            print('[FAIL] %s disagrees with ganno' % tag)
+        return outdir
+
+def check_formats(r, update):
+
+    """ every format and execution mode against the expected outputs """
+
+    # the serial runs give the expected outputs, two sources
+    # have theirs prefixed with two_
+    regions = ['chr1:g.3190_3215', 'chr1:g.5380_5420', 'chr2:g.4190_4215', 'chr1:g.15290_15310']
+    serial = r.annotate('serial', 'db', 'ref.fa', [])
+    serial2 = r.annotate('serial_two_sources', 'db', 'ref.fa', [], two_sources=True)
+    sat = r.saturate('saturate', 'db', 'ref.fa', regions)
+    if update:
+        r.update(serial)
+        r.update(serial2, 'two_')
+        r.update(sat)
+        print('[UPDATED] %s' % expdir)
+    r.check('serial', serial)
+    r.check('serial, two sources', serial2, 'two_')
+    r.check('saturate', sat)
+
+    # every format and mode must give the same
+    jobs = ['--jobs', '2', '--batch-size', '7']
+    bgzf = os.path.join('bgzf', 'ref.fa.gz')
+    twobit = os.path.join('twobit', 'ref.fa')
+    for tag, db, ref, extra, two_sources in [
+            ('mem', 'db', 'ref.fa', ['--mem'], False),
+            ('no transcript cache', 'db', 'ref.fa', ['--transcript-cache', '0'], False),
+            ('no memo', 'db', 'ref.fa', ['--memo', '0'], False),
+            ('jobs', 'db', 'ref.fa', jobs, False),
+            ('pipeline', 'db', 'ref.fa', ['--pipeline', '--batch-size', '7'], False),
+            ('pipeline, jobs', 'db', 'ref.fa', ['--pipeline']+jobs, False),
+            ('sort window', 'db', 'ref.fa', ['--sort-window', '16'], False),
+            ('line buffered', 'db', 'ref.fa', ['--line-buffered'], False),
+            ('small output buffer', 'db', 'ref.fa', ['--output-buffer', '100'], False),
+            ('two sources, mem', 'db', 'ref.fa', ['--mem'], True),
+            ('two sources, no transcript cache', 'db', 'ref.fa', ['--transcript-cache', '0'], True),
+            ('sql', 'dbsql', 'ref.fa', ['--sql'], False),
+            ('sql, jobs', 'dbsql', 'ref.fa', ['--sql']+jobs, False),
+            ('sql, no transcript cache', 'dbsql', 'ref.fa', ['--sql', '--transcript-cache', '0'], False),
+            ('two sources, sql', 'dbsql', 'ref.fa', ['--sql'], True),
+            ('2-bit reference', 'db', twobit, [], False),
+            ('bgzip reference', 'db', bgzf, [], False),
+            ('bgzip reference, jobs', 'db', bgzf, jobs, False),
+            ('cds_seq and snv_tab', 'dbseq', 'ref.fa', [], False),
+            ('cds_seq and snv_tab, mem', 'dbseq', 'ref.fa', ['--mem'], False),
+            ('cds_seq and snv_tab, sql', 'dbseq', 'ref.fa', ['--sql'], False),
+            ('cds_seq and snv_tab, jobs', 'dbseq', 'ref.fa', jobs, False),
+            ('two sources, cds_seq and snv_tab', 'dbseq', 'ref.fa', [], True)]:
+        outdir = r.annotate(tag.replace(',', '').replace(' ', '_'), db, ref, extra, two_sources)
+        r.check(tag, outdir, 'two_' if two_sources else '')
+
+    # written to a file by -O rather than to stdout
+    for tag, extra in [('output file', []), ('output file, jobs', jobs),
+                       ('output file, pipeline', ['--pipeline', '--batch-size', '7'])]:
+        outdir = r.annotate(tag.replace(',', '').replace(' ', '_'), 'db', 'ref.fa', extra, ofile=True)
+        r.check(tag, outdir)
+
+    sat = r.saturate('saturate_snv_tab', 'dbseq', 'ref.fa', regions)
+    r.check('saturate, cds_seq and snv_tab', sat)
+    sat = r.saturate('saturate_bgzip', 'db', bgzf, regions)
+    r.check('saturate, bgzip reference', sat)
+
+def expected_lines(fn):
+
+    """ lines of an expected output, without header """
+    with open(os.path.join(expdir, fn)) as fh:
+        return [line.rstrip('\n') for line in fh][1:]
+
+def check_api(r):
+
+    """ transvar.api.Annotator against the command line outputs """
+    import configparser
+    from transvar.api import Annotator, parse_info
+    config = configparser.RawConfigParser()
+    config.read(r.env['TRANSVAR_CFG'])
+    annotator = Annotator(config=config,
+                          ucsc=os.path.join(r.d, 'db', 'refgene.txt.transvardb'),
+                          reference=os.path.join(r.d, 'ref.fa'),
+                          idmap=os.path.join(r.d, 'idmap.idx'))
+
+    # the command line prints the errors met in annotating, e.g., a
+    # wrong reference base, but not the raised ones
+    for kind in 'gcp':
+        expected = expected_lines('%s.out' % kind)
+        failed = []
+        i = 0
+        with open(os.path.join(r.d, '%s.list' % kind)) as fh:
+            queries = [line.strip() for line in fh]
+        for q in queries:
+            lines = []
+            for res in annotator.annotate(q, kind):
+                # the fields are those of the output line
+                fields = res.line.split('\t')
+                if (res.query != q or
+                    [res.transcript, res.gene, res.strand] != fields[:3] or
+                    '/'.join([res.gnuc, res.tnuc, res.taa]) != fields[3] or
+                    res.region != fields[4] or
+                    res.info != parse_info(fields[5]) or
+                    res.csqn != res.info.get('CSQN', None)):
+                    failed.append(q)
+                line = q+'\t'+res.line
+                if 'Error' not in res.info or expected[i+len(lines):i+len(lines)+1] == [line]:
+                    lines.append(line)
+            if lines != expected[i:i+len(lines)]:
+                failed.append(q)
+            i += len(lines)
+        if i != len(expected):
+            failed.append('%d lines' % len(expected))
+        r.report('api, %sanno' % kind, failed)
+
+    # a query on an invalid gene or an unparsable query gives an
+    # Error result from the api, the command line prints nothing
+    failed = []
+    badfn = os.path.join(r.d, 'bad.list')
+    with open(badfn, 'w') as fh:
+        fh.write('NOSUCHGENE:p.V4F\ngarbage\n')
+    for q, kind, err in [('NOSUCHGENE:p.V4F', 'p', 'invalid_gene_NOSUCHGENE'),
+                         ('garbage', 'g', 'invalid_mutation_string: garbage (type:g)')]:
+        results = annotator.annotate(q, kind)
+        if (len(results) != 1 or results[0].transcript != '.' or
+            results[0].csqn is not None or results[0].info != {'Error': err}):
+            failed.append(q)
+        out = os.path.join(r.d, 'bad.out')
+        r.transvar(['%sanno' % kind, '-l', badfn,
+                    '--ucsc', os.path.join(r.d, 'db', 'refgene.txt.transvardb')], out)
+        with open(out) as fh:
+            if len(fh.readlines()) != 1: # the header
+                failed.append(q)
+    r.report('api, invalid queries', failed)
+
+def check_server(r):
+
+    """ transvar serve, on a free port, against the command line """
+    import threading
+    try:
+        from urllib.request import urlopen, Request
+        from urllib.error import HTTPError
+    except ImportError:
+        from urllib2 import urlopen, Request, HTTPError
+    from transvar.api import Options
+    from transvar.annodb import AnnoDB
+    from transvar.server import TransVarServer
+    import configparser
+    config = configparser.RawConfigParser()
+    config.read(r.env['TRANSVAR_CFG'])
+    dbargs = ['--ucsc', os.path.join(r.d, 'db', 'refgene.txt.transvardb'),
+              '--reference', os.path.join(r.d, 'ref.fa')]
+    args = Options(ucsc=dbargs[1], reference=dbargs[3])
+    args.host = '127.0.0.1'
+    args.port = 0
+    server = TransVarServer(args, AnnoDB(args, config))
+    url = 'http://127.0.0.1:%d' % server.server_address[1]
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    def post(path, body):
+        try:
+            res = urlopen(Request(url+path, body.encode('utf-8')))
+            return res.getcode(), res.read().decode('utf-8')
+        except HTTPError as e:
+            return e.code, e.read().decode('utf-8')
+
+    try:
+        # the first queries of the lists, and some with an error
+        for at in 'gc':
+            with open(os.path.join(r.d, '%s.list' % at)) as fh:
+                lines = [next(fh) for i in range(40)]
+            lines += ['chr1:g.12000A>T\n', 'chr1:g.3201_3203del\n', 'NOSUCHGENE:c.10G>T\n']
+            fn = os.path.join(r.d, 'server.list')
+            with open(fn, 'w') as fh:
+                fh.write(''.join(lines))
+            out = os.path.join(r.d, 'server.out')
+            r.transvar(['%sanno' % at, '-l', fn] + dbargs, out)
+            with open(out) as fh:
+                expected = fh.read()
+            code, text = post('/%sanno' % at, ''.join(lines))
+            failed = [] if (code, text) == (200, expected) else ['status %d, body' % code]
+            r.report('server, %sanno' % at, failed)
+
+        # malformed requests
+        failed = []
+        for path, body, status in [('/nosuch', 'chr1:g.500\n', 404), ('/ganno', '\n', 400)]:
+            code, text = post(path, body)
+            if code != status:
+                failed.append('%s %d' % (path, code))
+        r.report('server, malformed requests', failed)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def check_batch(r):
+
+    """ the batch position mappers of posbatch against gpos2codon and
+    tnuc2gnuc, with numpy when it is available and without """
+    import configparser
+    from transvar.api import Options
+    from transvar.annodb import AnnoDB
+    from transvar.transcripts import Pos
+    from transvar.err import IncompatibleTranscriptError
+    from transvar import posbatch
+    config = configparser.RawConfigParser()
+    config.read(r.env['TRANSVAR_CFG'])
+    args = Options(ucsc=os.path.join(r.d, 'db', 'refgene.txt.transvardb'),
+                   reference=os.path.join(r.d, 'ref.fa'))
+    db = AnnoDB(args, config)
+    tpts = []
+    for gene in sorted(set(t[1] for t in transcripts)):
+        for g in db.get_gene(gene):
+            for t in g.tpts:
+                t.ensure_seq()
+                if len(t.coding_positions()) > 0:
+                    tpts.append(t)
+
+    def _expected_(t, gpos, policy):
+        ret = t.gpos2codon(gpos, policy)
+        if ret is None:
+            return (0, 0, 0, 0, posbatch.REGION_NONE)
+        c, p = ret
+        if gpos < t.cds_beg:
+            region = posbatch.REGION_5PRIME if t.strand == '+' else posbatch.REGION_3PRIME
+        elif gpos > t.cds_end:
+            region = posbatch.REGION_3PRIME if t.strand == '+' else posbatch.REGION_5PRIME
+        elif p.tpos == 0:
+            region = posbatch.REGION_CODING
+        else:
+            region = posbatch.REGION_INTRONIC
+        return (c.index, (p.pos-1)%3, p.pos, p.tpos, region)
+
+    numpy = posbatch.numpy
+    for tag, np in [('numpy', numpy), ('no numpy', None)]:
+        if tag == 'numpy' and numpy is None:
+            print('[SKIP] batch mapping, numpy: numpy is not installed')
+            continue
+        posbatch.numpy = np
+        failed = []
+        try:
+            for t in tpts:
+                # UTR, intronic and outside the transcript
+                gposes = list(range(t.beg-30, t.end+30))
+                for policy in ['closer', 'c_smaller', 'c_greater', 'g_smaller', 'g_greater']:
+                    batch = list(zip(*[list(a) for a in t.gpos2codon_batch(gposes, policy)]))
+                    if batch != [_expected_(t, gpos, policy) for gpos in gposes]:
+                        failed.append('%s gpos2codon %s' % (t.name, policy))
+
+                n = len(t.coding_positions())
+                poses = list(range(1, n+1)) + [-1]*7
+                tposes = [i%11-5 for i in range(len(poses))]
+                batch = [int(g) for g in t.tnuc2gnuc_batch(poses, tposes)]
+                if batch != [t.tnuc2gnuc(Pos(p, tp)) for p, tp in zip(poses, tposes)]:
+                    failed.append('%s tnuc2gnuc' % t.name)
+                try:
+                    t.tnuc2gnuc_batch([1, n+1])
+                    failed.append('%s tnuc2gnuc beyond the CDS' % t.name)
+                except IncompatibleTranscriptError:
+                    pass
+        finally:
+            posbatch.numpy = numpy
+        r.report('batch mapping, %s' % tag, failed)
+
+# regions of queries whose output changed from that of transvar
+# 2.5.1 by a fix, one set for one source (refGene) and one for two
+# sources (refGene and knownGene)
+#
+# a span with both ends in one transcript is from_[...]_to_[...] or,
+# in a single region, inside_[...], without the transcript names that
+# tell ends in different transcripts (here of different sources)
+# apart; the ends were compared by identity and named when they were
+# read separately
+span_regions = [
+    ('chr1:g.3300_9100del',
+     ['from_[cds_in_exon_2]_to_[cds_in_exon_3]_spanning_[GENEY,GENEW]'],
+     ['from_[cds_in_exon_2%s]_to_[cds_in_exon_3%s]_spanning_[uc100002,uc100003,GENEY,GENEW]' % (a, b)
+      for a, b in [('', ''), (';GENEX', ';uc100001'), (';uc100001', ';GENEX')]]),
+    ('chr1:g.3500_8900del',
+     ['inside_[intron_between_exon_2_and_3]'],
+     ['inside_[intron_between_exon_2_and_3]'] +
+     ['from_[intron_between_exon_2_and_3;%s]_to_[intron_between_exon_2_and_3;%s]_spanning_[uc100002,uc100003,GENEY,GENEW]' % (a, b)
+      for a, b in [('GENEX', 'uc100001'), ('uc100001', 'GENEX')]]),
+    ('chr1:g.1050_18100del',
+     ['from_[5-UTR;noncoding_exon_1;GENEX]_to_[cds_in_exon_2;GENEZ]_spanning_[GENEY,GENEW]',
+      'from_[5-UTR;noncoding_exon_1;GENEX]_to_[cds_in_exon_3;GENEZ]_spanning_[GENEY,GENEW]'],
+     ['from_[5-UTR;noncoding_exon_1;%s]_to_[cds_in_exon_%s]_spanning_[uc100002,uc100003,GENEY,GENEW]' % (a, b)
+      for a in ['GENEX', 'uc100001'] for b in ['2;GENEZ', '2;uc100005', '3;GENEZ', '3;uc100004']]),
+]
+
+# the closest transcripts of an intergenic position are the closest
+# of all sources, they were the closest of the last source to have one
+closest_regions = [
+    ('chr1:g.1000T>A',
+     ["inside_[intergenic_between_5'-telomere(1000_bp)_and_GENEX(1_bp_upstream)]"],
+     ["inside_[intergenic_between_5'-telomere(1000_bp)_and_GENEX(1_bp_upstream)]"]),
+    ('chr1:g.15000G>A',
+     ['inside_[intergenic_between_GENEX(5400_bp_downstream)_and_GENEZ(1_bp_upstream)]'],
+     ['inside_[intergenic_between_uc100001(5400_bp_downstream)_and_GENEZ(1_bp_upstream)]']),
+    ('chr2:g.2000C>A',
+     ["inside_[intergenic_between_5'-telomere(2000_bp)_and_GENEU(1_bp_downstream)]"],
+     ["inside_[intergenic_between_5'-telomere(2000_bp)_and_GENEU(1_bp_downstream)]"]),
+]
+
+def sort_spanning(region):
+
+    """ the names spanned in the order of python 3, python 2 lists
+    them in the order of its dicts """
+    m = re.match(r'(.*_spanning_\[)(.*)(\])$', region)
+    if m is None:
+        return region
+    return m.group(1) + ','.join(sorted(m.group(2).split(','))) + m.group(3)
+
+def check_fixes(r):
+
+    """ the regions of span_regions and closest_regions, in the modes
+    that read transcripts differently """
+    for name, cases in [('spans in one transcript', span_regions),
+                        ('closest transcripts', closest_regions)]:
+        fn = os.path.join(r.d, 'fixes.list')
+        with open(fn, 'w') as fh:
+            fh.write(''.join(q+'\n' for q, one, two in cases))
+        failed = []
+        for tag, db, extra in [('default', 'db', []),
+                               ('no transcript cache', 'db', ['--transcript-cache', '0']),
+                               ('mem', 'db', ['--mem']),
+                               ('sql', 'dbsql', ['--sql'])]:
+            for two_sources in [False, True]:
+                out = os.path.join(r.d, 'fixes.out')
+                r.transvar(['ganno', '-l', fn] + r.dbargs(db, 'ref.fa', two_sources) + extra, out)
+                q2regions = {}
+                with open(out) as fh:
+                    next(fh)
+                    for line in fh:
+                        fields = line.split('\t')
+                        q2regions.setdefault(fields[0], set()).add(sort_spanning(fields[5]))
+                for q, one, two in cases:
+                    if q2regions.get(q) != set(sort_spanning(_) for _ in (two if two_sources else one)):
+                        failed.append('%s (%s%s)' % (q, tag, ', two sources' if two_sources else ''))
+        r.report(name, failed)
+
+CHECKS = ['formats', 'api', 'server', 'batch', 'fixes']
+
+def main():
+
+    parser = argparse.ArgumentParser(description='format and execution mode regression tests')
+    parser.add_argument('checks', nargs='*', help='run only these checks, among %s' % ', '.join(CHECKS))
+    parser.add_argument('--update', action='store_true', help='rewrite the expected outputs')
+    parser.add_argument('--keep', default=None, help='build in this directory and keep it')
+    args = parser.parse_args()
+    for c in args.checks:
+        if c not in CHECKS:
+            parser.error('unknown check %s' % c)
+    checks = args.checks or CHECKS
+    if args.update and 'formats' not in checks:
+        parser.error('--update takes the outputs of the formats check')
+    for tool in ['bgzip', 'tabix']:
+        if not any(os.access(os.path.join(p, tool), os.X_OK)
+                   for p in os.environ.get('PATH', '').split(os.pathsep)):
+            parser.error('%s is not in the PATH, transvar index needs it' % tool)
+    if sys.version_info[0] < 3:
+        for c in ['formats', 'api']:
+            if c in checks:
+                print('[SKIP] %s: the expected outputs are those of python 3, '
+                      'python 2 orders some lists of names differently' % c)
+        checks = [c for c in checks if c not in ('formats', 'api')]
+
+    if args.keep:
+        d = os.path.abspath(args.keep)
+        if os.path.exists(d):
+            shutil.rmtree(d)
+        os.makedirs(d)
+    else:
+        d = tempfile.mkdtemp(prefix='transvar_regress.')
+
+    r = Runner(d)
+    try:
+        r.prepare()
+        if 'formats' in checks:
+            check_formats(r, args.update)
+        if 'api' in checks:
+            check_api(r)
+        if 'server' in checks:
+            check_server(r)
+        if 'batch' in checks:
+            check_batch(r)
+        if 'fixes' in checks:
+            check_fixes(r)
+    finally:
+        if not args.keep:
+            shutil.rmtree(d)
+
+    if r.nfailed:
+        print('%d failed' % r.nfailed)
+        sys.exit(1)
+    print('all passed')
+
+if __name__ == '__main__':
+    main()
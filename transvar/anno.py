@@ -34,6 +34,9 @@ from .annodb import AnnoDB
 from .record import *
 from .err import *
 from .config import read_config
+from . import output
+from . import tcache
+from .memo import QueryMemo, query_key, report as report_memo
 from .mutation import parse_tok_mutation_str, list_parse_mutation, vcf_parse_mutation
 
 from .mnv import annotate_mnv_gdna, annotate_mnv_protein, annotate_mnv_cdna
@@ -137,37 +140,142 @@ def _main_(args, q, db, at):
 
     return
 
-def main_list(args, db, at, mutation_parser):
-    """ process a list of inputs """
-    for q, line in mutation_parser:
-        if q.tok is None:           # parsing error
-            r = Record()
-            r.append_info(q.msg)
-            r.format(q.op)
-            continue
+def _main_query_(args, q, db, at, memo=None, genes=None):
+    """ process 1 parsed input from a list
+    output of repeated queries is replayed from memo if given,
+    genes caches the genes (and their transcripts) resolved by name
+    """
 
-        if at == 'g':
-            q.tok = normalize_chrm(q.tok)
+    if q.tok is None:           # parsing error
+        r = Record()
+        r.append_info(q.msg)
+        r.format(q.op)
+        return
+
+    if at == 'g':
+        q.tok = normalize_chrm(q.tok)
+    else:
+        q.tok = q.tok.upper()
+
+    if memo is None:
+        _annotate_query_(args, q, db, at, genes)
+        return
+
+    key = query_key(q, at)
+    text = memo.get(key)
+    op = q.op
+    if text is None:
+        q.op = ''
+        try:
+            with output.capture() as buf:
+                _annotate_query_(args, q, db, at, genes)
+        finally:
+            q.op = op
+        text = buf.getvalue()
+        memo.put(key, text)
+
+    for line in text.splitlines(True):
+        output.write(op+'\t'+line if op else line)
+
+def _annotate_query_(args, q, db, at, genes=None):
+
+    if at == 'g':
+        _main_(args, q, db, at)
+    else:
+        if genes is None:
+            tok_genes = db.get_gene(q.tok, args.strictversion)
+        else:
+            if q.tok not in genes:
+                genes[q.tok] = list(db.get_gene(q.tok, args.strictversion))
+            tok_genes = genes[q.tok]
+
+        genefound = False
+        for q.gene in tok_genes:
             _main_(args, q, db, at)
+            genefound = True
+
+        if not genefound:
+            wrap_exception(Exception('invalid_gene_%s' % q.tok), q.op, args)
+            # r = Record()
+            # r.append_info('gene_not_recognized_(%s)' % q.tok)
+            # err_warn('gene %s not recognized. make sure the right (if any) transcript database is used.' % q.tok)
+            # r.format(q.op)
+            # continue
+
+def _query_locus_(q):
+    """ (chromosome, position) of a genomic query for sorting """
+    pos = getattr(q, 'pos', None)
+    if not isinstance(pos, int):
+        pos = q.beg
+    if not isinstance(pos, int):
+        pos = 0
+    return (q.tok or '', pos)
+
+def _query_gene_(q):
+    """ gene token of a cDNA/protein query for grouping """
+    return (q.tok or '').upper()
+
+def annotate_batch(args, db, at, batch, memo=None):
+    """ process a list of parsed inputs, return the output as a string
+    with args.sort_window, genomic queries are annotated in coordinate
+    order for locality of the reference and index lookups, cDNA and
+    protein queries are grouped by gene and each gene is loaded once
+    (transcript sequences are then also retrieved once), the output
+    stays in input order
+    """
+
+    if args.sort_window > 0:
+        if at == 'g':
+            key = _query_locus_
+            genes = None
         else:
-            q.tok = q.tok.upper()
-            genefound = False
-            for q.gene in db.get_gene(q.tok, args.strictversion):
-                _main_(args, q, db, at)
-                genefound = True
-
-            if not genefound:
-                wrap_exception(Exception('invalid_gene_%s' % q.tok), q.op, args)
-                # r = Record()
-                # r.append_info('gene_not_recognized_(%s)' % q.tok)
-                # err_warn('gene %s not recognized. make sure the right (if any) transcript database is used.' % q.tok)
-                # r.format(q.op)
-                # continue
-            
-        # try:
-        # except:
-        # err_print('exception %s' % line)
-        # raise Exception()
+            key = _query_gene_
+            genes = {}
+        texts = [None]*len(batch)
+        for i in sorted(range(len(batch)), key=lambda i: key(batch[i])):
+            with output.capture() as buf:
+                _main_query_(args, batch[i], db, at, memo, genes)
+            texts[i] = buf.getvalue()
+        return ''.join(texts)
+
+    with output.capture() as buf:
+        for q in batch:
+            _main_query_(args, q, db, at, memo)
+
+    return buf.getvalue()
+
+def list_batch_size(args):
+    """ number of queries annotated together """
+    if args.sort_window > 0:
+        return args.sort_window
+    return args.batch_size
+
+def main_list(args, db, at, mutation_parser):
+    """ process a list of inputs """
+
+    if args.pipeline:
+        from .pipeline import main_list_pipeline
+        main_list_pipeline(args, db, at, mutation_parser)
+        return
+
+    if args.jobs > 1:
+        from .parallel import main_list_parallel
+        main_list_parallel(args, at, mutation_parser)
+        return
+
+    memo = QueryMemo(args.memo) if args.memo > 0 else None
+    if args.sort_window > 0:
+        from .parallel import iter_batches
+        for batch in iter_batches(mutation_parser, args.sort_window):
+            output.write(annotate_batch(args, db, at, batch, memo))
+            output.end_query()
+    else:
+        for q, line in mutation_parser:
+            _main_query_(args, q, db, at, memo)
+            output.end_query()
+
+    if memo is not None and args.verbose > 0:
+        report_memo([(memo.hits, memo.misses)])
 
 def main_one(args, db, at):
 
@@ -205,18 +313,25 @@ def main_anno(args, at):
     config = read_config()
     db = AnnoDB(args, config)
 
-    if (not args.vcf) and (not args.noheader):
-        print(print_header(args))
+    output.open_sink(args)
+    try:
+        if (not args.vcf) and (not args.noheader):
+            output.write_line(print_header(args))
+
+        if args.l:
+            main_list(args, db, at, list_parse_mutation(args, at))
 
-    if args.l:
-        main_list(args, db, at, list_parse_mutation(args, at))
+        if args.vcf:
+            if at != 'g':
+                err_raise("can apply on ganno to VCF input")
+            main_list(args, db, at, vcf_parse_mutation(args, 'g'))
 
-    if args.vcf:
-        if at != 'g':
-            err_raise("can apply on ganno to VCF input")
-        main_list(args, db, at, vcf_parse_mutation(args, 'g'))
+        if args.i:
+            main_one(args, db, at)
 
-    if args.i:
-        main_one(args, db, at)
+        if args.verbose > 0:
+            tcache.report()
+    finally:
+        output.close_sink()
 
 
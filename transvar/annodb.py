@@ -28,10 +28,14 @@ SOFTWARE.
 """
 
 import os
+import hashlib
 from .transcripts import *
 from .localdb import TransVarDB, recheck_resource
+from .locindex import MergedLocIndex, remove_stale_files
+from .sqldb import SQLTransVarDB
+from .nameindex import open_name_index
+from . import tcache
 from . import parser
-from pickle import load
 
 class AnnoDB():
 
@@ -49,29 +53,28 @@ class AnnoDB():
         
         replace_defaults(args, config)
         
-        faidx.init_refgenome(args.reference if args.reference else None)
-        self.session = None
-        self.name2gene = {}
-        self.name2trnx = {}
-        self.thash = None
+        faidx.init_refgenome(args.reference if args.reference else None,
+                             args.reference_cache << 20)
+        # --sql reads the SQLite databases written by transvar index --sql
+        db_class = SQLTransVarDB if args.sql else TransVarDB
 
         self.dbs = []
         if args.ensembl:
-            self.dbs.append(TransVarDB(args.ensembl, source='Ensembl'))
+            self.dbs.append(db_class(args.ensembl, source='Ensembl'))
         if args.gencode:
-            self.dbs.append(TransVarDB(args.gencode, source='GENCODE'))
+            self.dbs.append(db_class(args.gencode, source='GENCODE'))
         if args.kg:
-            self.dbs.append(TransVarDB(args.kg, source='KnownGene'))
+            self.dbs.append(db_class(args.kg, source='KnownGene'))
         if args.ucsc:
-            self.dbs.append(TransVarDB(args.ucsc, source='UCSCRefGene'))
+            self.dbs.append(db_class(args.ucsc, source='UCSCRefGene'))
         if args.refseq:
-            self.dbs.append(TransVarDB(args.refseq, source='RefSeq'))
+            self.dbs.append(db_class(args.refseq, source='RefSeq'))
         if args.ccds:
-            self.dbs.append(TransVarDB(args.ccds, source='CCDS'))
+            self.dbs.append(db_class(args.ccds, source='CCDS'))
         if args.aceview:
-            self.dbs.append(TransVarDB(args.aceview, source='AceView'))
+            self.dbs.append(db_class(args.aceview, source='AceView'))
         if args.kg:
-            self.dbs.append(TransVarDB(args.kg, source='KnownGene'))
+            self.dbs.append(db_class(args.kg, source='KnownGene'))
 
         ## TODO: fix uniprot
         # if args.uniprot:
@@ -79,36 +82,63 @@ class AnnoDB():
         #     for db in self.dbs:
         #         db.idmap = idmap
         if args.idmap:
+            idmaps = {}         # a shared idmap file is opened once
+            def _open_idmap_(fn):
+                if fn not in idmaps:
+                    idmaps[fn] = open_name_index(fn)
+                return idmaps[fn]
+
             for db in self.dbs:
                 # import pdb; pdb.set_trace()
                 inferred_path = db.dbfn+'.'+args.idmap+'.idmap_idx'
                 if os.path.isfile(args.idmap):
-                    db.idmap = load(open(args.idmap, 'rb'))
+                    db.idmap = _open_idmap_(args.idmap)
                 elif os.path.isfile(inferred_path):
-                    db.idmap = load(open(inferred_path, 'rb'))
+                    db.idmap = _open_idmap_(inferred_path)
+                elif args.sql and db.has_idmap(args.idmap):
+                    db.idmap = db.load_idmap(args.idmap)
                 elif get_config(config, args.idmap, rv='idmap'):
                     # try database-independent idmapping
                     # import pdb; pdb.set_trace()
-                    db.idmap = load(open(recheck_resource(get_config(config, args.idmap, rv='idmap')), 'rb'))
+                    db.idmap = _open_idmap_(recheck_resource(get_config(config, args.idmap, rv='idmap')))
                 
         self.config = config
         self.args = args
         self.resources = {}
         self.init_resource()
 
-        # The following in-memory processing is unfinished
-        # One needs to handle integratively transcript ID
-        # input and gene ID input. NOT necessary.
-        # The speed-up may not worth the effort.
+        # one object per transcript and process, --mem holds
+        # all of them anyway
+        tcache.init(0 if args.mem else args.transcript_cache << 20)
+
+        # preload all transcripts, name and location lookups
+        # are then answered from memory
         if args.mem:
             for db in self.dbs:
-                db.parse_all(self.name2gene, self.name2trnx)
+                db.parse_all()
+
+        self.merged_loc = None
+        if (not args.mem and len(self.dbs) > 1 and
+            all(db.store is not None for db in self.dbs)):
+            self.init_merged_loc()
 
-            self.thash = THash()
-            genes = set(self.name2gene.values())
-            for g in genes:
-                for t in g.tpts:
-                    self.thash.insert(t)
+    def init_merged_loc(self):
+
+        """ one location index over all the sources, cached next to the
+        first database as <db>.<sources>.<version>.merged_loc, keyed on
+        the sources and on their index files. The index of an earlier
+        version of the same sources is removed when it is rebuilt """
+        hs = hashlib.md5()
+        hv = hashlib.md5()
+        for db in self.dbs:
+            st = os.stat(db.dbfn+'.trxn_bin')
+            hs.update(('%s\t%s\n' % (db.source, os.path.abspath(db.dbfn))).encode('utf-8'))
+            hv.update(('%d\t%d\n' % (st.st_size, int(st.st_mtime))).encode('utf-8'))
+        prefix = '%s.%s.' % (self.dbs[0].dbfn, hs.hexdigest()[:12])
+        fn = '%s%s.merged_loc' % (prefix, hv.hexdigest()[:12])
+        if not os.path.exists(fn):
+            remove_stale_files(prefix, '.merged_loc')
+        self.merged_loc = MergedLocIndex(fn, [db.store for db in self.dbs])
 
     def init_resource(self):
         """ init features and other annotation resources """
@@ -233,6 +263,14 @@ class AnnoDB():
 
     def get_transcripts(self, chrm, beg, end=None, flanking=0):
 
+        if self.merged_loc is not None:
+            if not end: end = beg
+            for si, rid in self.merged_loc.overlap(
+                    normalize_chrm(chrm), beg-flanking, end+flanking):
+                db = self.dbs[si]
+                yield tcache.canonical(db.store.transcript(rid, db.source))
+            return
+
         for db in self.dbs:
             for t in db.get_by_loc(chrm, beg, end, flanking):
                 yield t
@@ -245,6 +283,7 @@ class AnnoDB():
             t = db.get_closest_upstream(chrm, pos)
             if t is not None and t.end > max_end:
                 max_t = t
+                max_end = t.end
 
         return max_t
 
@@ -256,6 +295,7 @@ class AnnoDB():
             t = db.get_closest_downstream(chrm, pos)
             if t is not None and t.beg < min_beg:
                 min_t = t
+                min_beg = t.beg
 
         return min_t
 
@@ -0,0 +1,241 @@
+"""
+The MIT License
+
+Copyright (c) 2015
+The University of Texas MD Anderson Cancer Center
+Wanding Zhou, Tenghui Chen, Ken Chen (kchen3@mdanderson.org)
+
+Permission is hereby granted, free of charge, to any person obtaining
+a copy of this software and associated documentation files (the
+"Software"), to deal in the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+
+## in-process annotation API
+##
+##   from transvar.api import Annotator
+##   annotator = Annotator(refversion='hg19', ccds=True)
+##   for res in annotator.annotate_batch(['PIK3CA:p.E545K'], kind='p'):
+##       print(res.query, res.transcript, res.gnuc, res.csqn, res.info)
+##
+## Annotator takes the command line options as keyword arguments
+## (transcript sources as True to use the configured database or as a
+## path) and returns Result objects instead of printing.
+
+from .annodb import AnnoDB
+from .config import read_config
+from .mutation import parse_tok_mutation_str
+from .utils import normalize_chrm
+from . import record
+from .record import wrap_exception
+from . import anno
+
+# defaults of the command line options, see bin/transvar
+DEFAULT_OPTIONS = {
+    # annotation
+    'longest': False,
+    'longestcoding': False,
+    'refversion': None,
+    'reference': '_DEF_',
+    'reference_cache': 64,
+    'ensembl': None,
+    'gencode': None,
+    'kg': None,
+    'alias': None,
+    'ucsc': None,
+    'refseq': None,
+    'ccds': None,
+    'aceview': None,
+    'idmap': None,
+    'uniprot': None,
+    'mem': False,
+    'sql': False,
+    'transcript_cache': 256,
+    'prombeg': 1000,
+    'promend': 0,
+    'strictversion': False,
+    # mutation
+    'noheader': False,
+    'i': None,
+    'l': None,
+    'vcf': None,
+    'd': '\t',
+    'g': -1,
+    'p': -1,
+    'n': -1,
+    'r': -1,
+    'a': -1,
+    't': -1,
+    'm': 1,
+    'o': '-',
+    'skipheader': False,
+    'seqmax': 10,
+    'nc': 10,
+    'oneline': False,
+    'aa3': False,
+    'aacontext': 0,
+    'haplotype': False,
+    'pp': False,
+    'ppp': False,
+    'gseq': False,
+    'memo': 0,
+    'sort_window': 0,
+    'jobs': 1,
+    'pipeline': False,
+    'batch_size': 200,
+    'queue_size': 8,
+    # general
+    'suspend': False,
+    'ignore': False,
+    'verbose': 0,
+}
+
+# options taking '_DEF_' for the database configured in transvar.cfg
+SOURCE_OPTIONS = ['ensembl', 'gencode', 'kg', 'alias', 'ucsc', 'refseq',
+                  'ccds', 'aceview', 'uniprot']
+
+class Options(object):
+
+    """ stand-in for the parsed command line arguments """
+
+    def __init__(self, **kwargs):
+
+        self.__dict__.update(DEFAULT_OPTIONS)
+        for k, v in kwargs.items():
+            if k not in DEFAULT_OPTIONS:
+                raise TypeError('unknown option %s' % k)
+            if k in SOURCE_OPTIONS and v is True:
+                v = '_DEF_'
+            setattr(self, k, v)
+
+def parse_info(info):
+
+    """ split a ;-separated info field into a dict
+    flags without value map to True, values of repeated keys
+    are joined by ';'
+    """
+    d = {}
+    if not info or info == '.':
+        return d
+
+    for f in info.split(';'):
+        if '=' in f:
+            k, v = f.split('=', 1)
+        else:
+            k, v = f, True
+        if k in d and v is not True and d[k] is not True:
+            d[k] += ';'+v
+        else:
+            d[k] = v
+
+    return d
+
+class Result(object):
+
+    """ annotation of a query on one transcript (one output line) """
+
+    def __init__(self, query, r, args):
+
+        # finalizes the info field (CSQN, dbxref, aliases, source)
+        self.line = r.formats(args)
+        self.record = r
+        self.query = query
+        self.transcript = r.tname
+        self.gene = r.gene
+        self.strand = r.strand
+        self.chrm = r.chrm
+        self.gnuc = r.gnuc()
+        self.tnuc = r.tnuc()
+        self.taa = r.taa()
+        self.region = r.reg if isinstance(r.reg, str) else r.reg.format()
+        self.info = parse_info(r.info)
+        self.csqn = self.info.get('CSQN', None)
+
+    def __repr__(self):
+        return '<Result %s %s %s/%s/%s>' % (
+            self.query, self.transcript, self.gnuc, self.tnuc, self.taa)
+
+class Annotator(object):
+
+    """ annotate variants in-process with the databases loaded once """
+
+    def __init__(self, config=None, **options):
+
+        self.args = Options(**options)
+        if config is None:
+            config = read_config()
+        self.db = AnnoDB(self.args, config)
+
+    def _annotate_(self, q, kind):
+
+        args = self.args
+        if kind == 'g':
+            q.tok = normalize_chrm(q.tok)
+            genes = [None]
+        else:
+            q.tok = q.tok.upper()
+            genes = list(self.db.get_gene(q.tok, args.strictversion))
+            if not genes:
+                record.record_sink(q.op, [wrap_exception(
+                    Exception('invalid_gene_%s' % q.tok), q.op, args)])
+
+        for q.gene in genes:
+            try:
+                anno._main_core_(args, q, self.db, kind)
+            except Exception as e:
+                record.record_sink(q.op, [wrap_exception(e, q.op, args)])
+
+    def annotate(self, query, kind='g'):
+
+        """ annotate one query string, e.g., chr3:g.178936091G>A
+        kind is 'g', 'c' or 'p' for gDNA, cDNA and protein queries
+        return a list of Result
+        """
+        if kind not in ('g', 'c', 'p'):
+            raise ValueError('kind must be g, c or p')
+
+        args = self.args
+        results = []
+        def _collect_(op, records):
+            for r in records:
+                results.append(Result(query, r, args))
+
+        sink = record.record_sink
+        record.record_sink = _collect_
+        try:
+            try:
+                q = parse_tok_mutation_str(query, kind)
+            except Exception as e:
+                _collect_(query, [wrap_exception(e, query, args)])
+                return results
+            q.op = query
+            self._annotate_(q, kind)
+        finally:
+            record.record_sink = sink
+
+        return results
+
+    def annotate_batch(self, queries, kind='g'):
+
+        """ annotate an iterable of query strings
+        yield the Result objects in input order
+        """
+        for query in queries:
+            for res in self.annotate(query.strip(), kind):
+                yield res
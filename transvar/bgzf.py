@@ -0,0 +1,145 @@
+"""
+The MIT License
+
+Copyright (c) 2015
+The University of Texas MD Anderson Cancer Center
+Wanding Zhou, Tenghui Chen, Ken Chen (kchen3@mdanderson.org)
+
+Permission is hereby granted, free of charge, to any person obtaining
+a copy of this software and associated documentation files (the
+"Software"), to deal in the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+
+## random access into a bgzip-compressed file
+##
+## A BGZF file is a series of gzip members (blocks) of at most 64 kb
+## of uncompressed data. The .gzi index written by "bgzip -i" or
+## "samtools faidx" lists the compressed and uncompressed offset of
+## each block but the first, so an uncompressed offset maps to its
+## block by binary search and only the blocks covering a read are
+## inflated. Without a .gzi, the block offsets are collected from the
+## block headers. Inflated blocks are kept in an LRU cache bounded in
+## bytes, so sorted input inflates each block about once.
+
+import os
+import struct
+import zlib
+from collections import OrderedDict
+from bisect import bisect_right
+from .err import err_die
+
+BGZF_HEADER = struct.Struct('<4BI2BH')  # up to XLEN
+BGZF_MAGIC = (31, 139, 8, 4)
+
+def read_gzi(fn):
+
+    """ (compressed offsets, uncompressed offsets) of the blocks """
+    with open(fn, 'rb') as fh:
+        n, = struct.unpack('<Q', fh.read(8))
+        pairs = struct.unpack('<%dQ' % (2*n), fh.read(16*n))
+    return [0]+list(pairs[0::2]), [0]+list(pairs[1::2])
+
+def _block_size_(fh, coff):
+
+    """ compressed size of the block at coff, None at the end """
+    fh.seek(coff)
+    header = fh.read(BGZF_HEADER.size)
+    if len(header) < BGZF_HEADER.size:
+        return None
+    fields = BGZF_HEADER.unpack(header)
+    if fields[:4] != BGZF_MAGIC:
+        err_die('%s is not bgzip-compressed, use bgzip rather than gzip' % fh.name)
+    extra = fh.read(fields[-1])
+    i = 0
+    while i+4 <= len(extra):    # subfields SI1, SI2, SLEN, data
+        si1, si2, slen = struct.unpack_from('<BBH', extra, i)
+        if si1 == 66 and si2 == 67: # 'BC', the block size - 1
+            return struct.unpack_from('<H', extra, i+4)[0]+1
+        i += 4+slen
+    err_die('%s is not bgzip-compressed, use bgzip rather than gzip' % fh.name)
+
+def scan_blocks(fh):
+
+    """ block offsets from the block headers, when there is no .gzi """
+    coffs, uoffs = [], []
+    coff = uoff = 0
+    while True:
+        bsize = _block_size_(fh, coff)
+        if bsize is None:
+            break
+        fh.seek(coff+bsize-4)
+        isize, = struct.unpack('<I', fh.read(4))
+        coffs.append(coff)
+        uoffs.append(uoff)
+        coff += bsize
+        uoff += isize
+    return coffs, uoffs
+
+class BgzfReader():
+
+    def __init__(self, fn, cache_bytes=64<<20):
+
+        self.fh = open(fn, 'rb')
+        if os.path.exists(fn+'.gzi'):
+            self.coffs, self.uoffs = read_gzi(fn+'.gzi')
+        else:
+            self.coffs, self.uoffs = scan_blocks(self.fh)
+        self.cache_bytes = cache_bytes
+        self.cache = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def block(self, k):
+
+        """ inflated block k """
+        data = self.cache.pop(k, None)
+        if data is not None:
+            self.hits += 1
+            self.cache[k] = data
+            return data
+
+        self.misses += 1
+        bsize = _block_size_(self.fh, self.coffs[k])
+        self.fh.seek(self.coffs[k])
+        data = zlib.decompress(self.fh.read(bsize), 31)
+        self.cache[k] = data
+        self.nbytes += len(data)
+        while self.nbytes > self.cache_bytes and len(self.cache) > 1:
+            self.nbytes -= len(self.cache.popitem(last=False)[1])
+        return data
+
+    def read(self, uoff, n):
+
+        """ n bytes from uncompressed offset uoff """
+        k = bisect_right(self.uoffs, uoff)-1
+        parts = []
+        while n > 0 and k < len(self.uoffs):
+            data = self.block(k)
+            s = uoff-self.uoffs[k]
+            part = data[s:s+n]
+            parts.append(part)
+            n -= len(part)
+            uoff += len(part)
+            k += 1
+        return b''.join(parts)
+
+    def close(self):
+        self.fh.close()
@@ -0,0 +1,188 @@
+"""
+The MIT License
+
+Copyright (c) 2015
+The University of Texas MD Anderson Cancer Center
+Wanding Zhou, Tenghui Chen, Ken Chen (kchen3@mdanderson.org)
+
+Permission is hereby granted, free of charge, to any person obtaining
+a copy of this software and associated documentation files (the
+"Software"), to deal in the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+
+## compact binary transcript store (.transvardb.trxn_bin)
+##
+## Written by "transvar index" next to the text .transvardb, it holds
+## the same transcripts in the same order as fixed-width records, so a
+## transcript is decoded with struct, without text parsing or eval().
+##
+## layout (little endian):
+##   header   magic, number of records, exons, strings, and the
+##            offsets of the sections below
+##   records  one RECORD per transcript, in .transvardb order
+##   textpos  uint64 offset of each transcript's line in .transvardb,
+##            ascending, used to map the gene/transcript name indices
+##            (which point into .transvardb) to record numbers
+##   exons    int32 (beg, end) pairs
+##   strings  uint32 offsets (n+1) into a utf-8 blob of distinct strings
+
+import struct
+import mmap
+from .transcripts import Transcript
+
+MAGIC = b'TVDBBIN1'
+HEADER = struct.Struct('<8sIIIQQQQQ')
+# gene_name, name, version, transcript_type, beg, end, chrm, strand,
+# cds_beg, cds_end, first exon, number of exons, aliases, gene_dbxref
+RECORD = struct.Struct('<IIiIiiIIiiIIII')
+OFFSET = struct.Struct('<Q')
+EXON = struct.Struct('<ii')
+STROFF = struct.Struct('<I')
+
+def write_store(fn, entries):
+
+    """ entries: list of (offset in .transvardb, gene name, gene dbxref,
+    transcript) in .transvardb order """
+
+    strings = []
+    string_ids = {}
+    def _sid_(s):
+        if s not in string_ids:
+            string_ids[s] = len(strings)
+            strings.append(s)
+        return string_ids[s]
+
+    records = []
+    textpos = []
+    exons = []
+    for pos, gname, dbxref, t in entries:
+        records.append(RECORD.pack(
+            _sid_(gname), _sid_(t.name), t.version, _sid_(t.transcript_type),
+            t.beg, t.end, _sid_(t.chrm), _sid_(t.strand), t.cds_beg, t.cds_end,
+            len(exons), len(t.exons), _sid_(';'.join(t.aliases)),
+            _sid_(dbxref)))
+        textpos.append(OFFSET.pack(pos))
+        for beg, end in t.exons:
+            exons.append(EXON.pack(beg, end))
+
+    blobs = [s.encode('utf-8') for s in strings]
+    stroffs = [0]
+    for b in blobs:
+        stroffs.append(stroffs[-1]+len(b))
+
+    rec_off = HEADER.size
+    textpos_off = rec_off + RECORD.size*len(records)
+    exon_off = textpos_off + OFFSET.size*len(textpos)
+    stroff_off = exon_off + EXON.size*len(exons)
+    blob_off = stroff_off + STROFF.size*len(stroffs)
+
+    with open(fn, 'wb') as fh:
+        fh.write(HEADER.pack(MAGIC, len(records), len(exons), len(strings),
+                             rec_off, textpos_off, exon_off, stroff_off, blob_off))
+        fh.write(b''.join(records))
+        fh.write(b''.join(textpos))
+        fh.write(b''.join(exons))
+        fh.write(b''.join(STROFF.pack(o) for o in stroffs))
+        fh.write(b''.join(blobs))
+
+class TranscriptStore():
+
+    """ memory-mapped reader of a .trxn_bin file """
+
+    def __init__(self, fn):
+
+        self.fh = open(fn, 'rb')
+        self.mm = mmap.mmap(self.fh.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.nrec, self.nexon, self.nstr, self.rec_off,
+         self.textpos_off, self.exon_off, self.stroff_off,
+         self.blob_off) = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            raise ValueError('%s is not a transcript store' % fn)
+        self._strings = {}
+        self.seq_store = None   # set when a .cds_seq is present
+        self.snv_table = None   # set when a .snv_tab is present
+
+    def string(self, sid):
+        s = self._strings.get(sid)
+        if s is None:
+            b, e = struct.unpack_from('<II', self.mm, self.stroff_off+STROFF.size*sid)
+            s = self.mm[self.blob_off+b:self.blob_off+e].decode('utf-8')
+            self._strings[sid] = s
+        return s
+
+    def rid_at(self, pos):
+
+        """ record number of the transcript at offset pos of .transvardb """
+        lo, hi = 0, self.nrec
+        while lo < hi:
+            mid = (lo+hi)//2
+            if OFFSET.unpack_from(self.mm, self.textpos_off+OFFSET.size*mid)[0] < pos:
+                lo = mid+1
+            else:
+                hi = mid
+        if lo < self.nrec and OFFSET.unpack_from(
+                self.mm, self.textpos_off+OFFSET.size*lo)[0] == pos:
+            return lo
+        return None
+
+    def location(self, rid):
+        """ (chrm, beg, end, name) of a record """
+        r = RECORD.unpack_from(self.mm, self.rec_off+RECORD.size*rid)
+        return (self.string(r[6]), r[4], r[5], self.string(r[1]))
+
+    def gene_name(self, rid):
+        return self.string(RECORD.unpack_from(self.mm, self.rec_off+RECORD.size*rid)[0])
+
+    def transcript(self, rid, source=None):
+
+        (gname, name, version, ttype, beg, end, chrm, strand, cds_beg, cds_end,
+         exon0, nexon, aliases, dbxref) = RECORD.unpack_from(
+             self.mm, self.rec_off+RECORD.size*rid)
+
+        t = Transcript()
+        t.gene_name = self.string(gname)
+        t.name = self.string(name)
+        t.version = version
+        t.transcript_type = self.string(ttype)
+        t.beg = beg
+        t.end = end
+        t.chrm = self.string(chrm)
+        t.strand = self.string(strand)
+        t.cds_beg = cds_beg
+        t.cds_end = cds_end
+        ex = struct.unpack_from('<%di' % (nexon*2), self.mm,
+                                self.exon_off+EXON.size*exon0)
+        t.exons = list(zip(ex[0::2], ex[1::2]))
+        aliases = self.string(aliases)
+        if aliases:
+            t.aliases = aliases.split(';')
+        t.gene_dbxref = self.string(dbxref)
+        t.source = source
+        t.rid = rid
+        t.seq_store = self.seq_store
+        t.snv_table = self.snv_table
+        return t
+
+    def iter_gene(self, rid, gname, source=None):
+
+        """ transcripts of gene gname starting at record rid """
+        while rid < self.nrec and self.gene_name(rid) == gname:
+            yield self.transcript(rid, source)
+            rid += 1
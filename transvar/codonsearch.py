@@ -34,7 +34,8 @@ from .err import *
 from .utils import *
 from .config import read_config
 from .snv import __core_annotate_codon_snv
-from .record import Query, QueryREG
+from .record import Query, QueryREG, same_transcript
+from . import output
 
 outformat="{altid}\t{chrm}\t{codon1}\t{codon2}\t{tptstr}"
 
@@ -52,7 +53,7 @@ def _main_core_(args, q, db):
             gpos = c1.locs[cind]
             for t2 in db.get_transcripts(t1.chrm, gpos):
                 c2, p = t2.gpos2codon(gpos)
-                if t1 == t2: continue
+                if same_transcript(t1, t2): continue
                 if p.tpos != 0: continue
                 # if c2.region != 'coding': continue
                 if c1.index == c2.index: continue
@@ -75,12 +76,12 @@ def _main_core_(args, q, db):
         else: s = ''
         s += outformat.format(altid=altid, tptstr=','.join(tpairs), chrm=chrm,
                               codon1='-'.join(map(str,c1)), codon2='-'.join(map(str,c2)))
-        print(s)
+        output.write_line(s)
 
 def main_list(args, db): #name2gene, thash):
 
     if not args.noheader:
-        print('origin_id\talt_id\tchrm\tcodon1\tcodon2\ttranscripts_choice')
+        output.write_line('origin_id\talt_id\tchrm\tcodon1\tcodon2\ttranscripts_choice')
     for q, line in list_parse_mutation(args, 'p'):
 
         genefound = False
@@ -94,12 +95,13 @@ def main_list(args, db): #name2gene, thash):
                 wrap_exception(e, q.op, args)
         if not genefound:
             err_warn('gene %s is not recognized.' % q.tok)
+        output.end_query()
 
 
 def main_one(args, db): #name2gene, thash):
 
     if not args.noheader:
-        print('origin_id\talt_id\tchrm\tcodon1\tcodon2\ttranscripts_choice')
+        output.write_line('origin_id\talt_id\tchrm\tcodon1\tcodon2\ttranscripts_choice')
     q = parse_tok_mutation_str(args.i, 'p')
     q.op = args.i
     genefound = False
@@ -118,8 +120,12 @@ def main_codonsearch(args):
     db = AnnoDB(args, config)
     # name2gene, thash = parse_annotation(args)
 
-    if args.l:
-        main_list(args, db) #name2gene, thash)
-    if args.i:
-        main_one(args, db) #name2gene, thash)
+    output.open_sink(args)
+    try:
+        if args.l:
+            main_list(args, db) #name2gene, thash)
+        if args.i:
+            main_one(args, db) #name2gene, thash)
+    finally:
+        output.close_sink()
 
@@ -1,21 +1,31 @@
 """ faidx python code adapted from Allen Yu
 http://www.allenyu.info/item/24-quickly-fetch-sequence-from-samtools-faidx-indexed-fasta-sequences.html """
 import sys
+import os
 import mmap
+from collections import OrderedDict
 
 from .err import *
 from .utils import *
 
 class RefGenome:
 
-    def __init__(self, fasta_file):
+    def __init__(self, fasta_file, cache_bytes=64<<20):
         self.faidx = {}
 
         self.fasta_file=fasta_file
 
+        # bgzip-compressed FASTA (.fa.gz) is read block by block,
+        # cache_bytes bounds the inflated blocks kept
+        self.bgzf = None
         try:
-            self.fasta_fd = open(fasta_file)
-            self.fasta_handle = mmap.mmap(self.fasta_fd.fileno(), 0, access=mmap.ACCESS_READ)
+            self.fasta_fd = open(fasta_file, 'rb')
+            if self.fasta_fd.read(2) == b'\x1f\x8b':
+                from .bgzf import BgzfReader
+                self.bgzf = BgzfReader(fasta_file, cache_bytes)
+                self.fasta_handle = None
+            else:
+                self.fasta_handle = mmap.mmap(self.fasta_fd.fileno(), 0, access=mmap.ACCESS_READ)
         except IOError:
             print("Reference sequence doesn't exist")
 
@@ -25,6 +35,15 @@ class RefGenome:
             print("samtools faidx file doesn't exist for reference")
         self.load_faidx()
 
+        # the 2-bit packed copy written by transvar index --twobit
+        # is read instead of the FASTA, unless the FASTA is newer
+        self.twobit = None
+        twobit_fn = fasta_file+'.tv2bit'
+        if (os.path.exists(twobit_fn) and
+            os.path.getmtime(twobit_fn) >= os.path.getmtime(fasta_file)):
+            from .twobit import TwoBitGenome
+            self.twobit = TwoBitGenome(twobit_fn)
+
     # Function to cache fasta index in dictionary
     # faidx format contains the following columns:
     ##.the name of the sequence
@@ -42,16 +61,10 @@ class RefGenome:
             slen,offset,blen,bytelen=[int(i) for i in cols[1:]]
             self.faidx[chrom]=(slen,offset,blen,bytelen)
 
-    # Function to fetch sequence from an indexed fasta
-    # *chrom--Chromosome name (str)
-    # *start--Start position (1-based) (int)
-    # *end--End position (1-based) (int)
-    # *keepN--Keep ambiguous bases in sequence (boolean)
-    def fetch_sequence(self, chrom, start, end):
+    def locate(self, chrom, start, end):
 
-        # Fetch a sequence from start to end in 1-based coordinates
-        seq=[]
-        seq_len=0
+        """ name of chrom in the index and the 0-based half-open window
+        [start, end) of the 1-based closed window [start, end] """
 
         if chrom not in self.faidx:
             if chrom.startswith('chr') and chrom[3:] in self.faidx:
@@ -76,21 +89,40 @@ class RefGenome:
         if start>=end:
             raise SequenceRetrievalError('Start position %d is larger than end position %d' % (start+1,end))
 
-        self.fasta_handle.seek(offset+start//blen*bytelen+start%blen)
+        return chrom, start, end
 
-        while seq_len<end-start:
-            line=self.fasta_handle.readline().decode()
-            line=line[:-1] #Remove newline symbols
-            seq_len=seq_len+len(line)
-            seq.append(line)
+    # Function to fetch sequence from an indexed fasta
+    # *chrom--Chromosome name (str)
+    # *start--Start position (1-based) (int)
+    # *end--End position (1-based) (int)
+    # returns upper-case bytes
+    def fetch_sequence_bytes(self, chrom, start, end):
 
-        seq=''.join(seq)
+        chrom, start, end = self.locate(chrom, start, end)
+        if self.twobit is not None:
+            return self.twobit.fetch(chrom, start, end)
+        slen,offset,blen,bytelen=self.faidx[chrom]
+
+        # the byte range follows from the line geometry in .fai,
+        # one slice of the mmap and the line breaks dropped in bulk
+        b = offset+start//blen*bytelen+start%blen
+        e = offset+(end-1)//blen*bytelen+(end-1)%blen+1
+        if self.bgzf is not None:
+            raw = self.bgzf.read(b, e-b)
+        else:
+            raw = self.fasta_handle[b:e]
+        return raw.translate(None, b'\r\n').upper()
+
+    def fetch_sequence(self, chrom, start, end):
 
-        #chomp off extra bases
-        return seq[:end-start].upper()
+        """ fetch a sequence from start to end in 1-based coordinates """
+        return self.fetch_sequence_bytes(chrom, start, end).decode()
 
     def __exit__(self, type, value, traceback):
-        self.fasta_handle.close()
+        if self.bgzf is not None:
+            self.bgzf.close()
+        else:
+            self.fasta_handle.close()
         self.fasta_fd.close()
         self.faidx_handle.close()
 
@@ -98,9 +130,10 @@ class RefGenome:
         slen,offset,blen,bytelen=self.faidx[chrm]
         return slen
 
-def init_refgenome(r=None):
-    global refgenome
-    refgenome = RefGenome(r) if r else None
+def init_refgenome(r=None, cache_bytes=64<<20):
+    global refgenome, window_cache
+    refgenome = RefGenome(r, cache_bytes) if r else None
+    window_cache = WindowCache()
 
 def getseq(chrm, beg, end):
 
@@ -114,26 +147,95 @@ def reflen(chrm):
     except KeyError:
         raise WrongReferenceError("Invalid_reference_%s" % chrm)
 
+## reference windows shared by all SeqBufs
+##
+## Indel normalization creates a SeqBuf for every roll, several per
+## variant. The bases come from windows of WINDOW bases keyed by
+## (chromosome, window index) and kept in a process-wide LRU, so rolls
+## at nearby positions share their fetches. A SeqBuf that walks off its
+## 2 kb buffer (a long repeat) prefetches ahead in the direction of the
+## walk, twice as far each time, in a single fetch.
+
+WINDOW = 4096
+MAXSPAN = 1<<20
+
+class WindowCache():
+
+    def __init__(self, maxwindows=1024):
+        self.windows = OrderedDict()
+        self.maxwindows = maxwindows
+
+    def window(self, chrom, i):
+
+        """ sequence of window i, bases i*WINDOW+1 to (i+1)*WINDOW """
+        key = (chrom, i)
+        if key not in self.windows:
+            self.prefetch(chrom, i*WINDOW+1, (i+1)*WINDOW)
+        w = self.windows.pop(key)
+        self.windows[key] = w   # most recently used
+        return w
+
+    def prefetch(self, chrom, beg, end):
+
+        """ load the windows covering [beg, end] with one fetch """
+        global refgenome
+        beg = max(1, beg)
+        end = min(end, refgenome.chrm2len(chrom))
+        if beg > end:
+            return
+        missing = [i for i in range((beg-1)//WINDOW, (end-1)//WINDOW+1)
+                   if (chrom, i) not in self.windows]
+        if not missing:
+            return
+        i0, i1 = missing[0], missing[-1]
+        seq = refgenome.fetch_sequence(
+            chrom, i0*WINDOW+1, min((i1+1)*WINDOW, refgenome.chrm2len(chrom)))
+        for i in range(i0, i1+1):
+            self.windows[(chrom, i)] = seq[(i-i0)*WINDOW:(i-i0+1)*WINDOW]
+        while len(self.windows) > self.maxwindows:
+            self.windows.popitem(last=False)
+
+window_cache = WindowCache()
+
 class SeqBuf():
 
     def __init__(self, chrm, p):
-        """ this construct saves 1kb flanking sequences """
+        """ this construct covers 1kb flanking sequences """
 
+        self.chrm = None
+        self.span = 2001
         self.reset(chrm, p)
 
     def reset(self, chrm, p):
 
+        global refgenome
+        # the same checks as fetching the 1kb flanks
+        chrom, beg, end = refgenome.locate(chrm, p - 1000, p + 1000)
+        if end - beg != 2001:
+            raise WrongReferenceError("Invalid_position_%d_(expect_from_0_to_%d_at_%s)" % (p, refgenome.chrm2len(chrm), chrm))
+
+        if chrm == self.chrm:   # walked off the buffer, read further ahead
+            self.span = min(self.span*2, MAXSPAN)
+            if p >= self.end:
+                window_cache.prefetch(chrom, p, p + self.span)
+            else:
+                window_cache.prefetch(chrom, p - self.span, p)
+        else:
+            window_cache.prefetch(chrom, p - 1000, p + 1000)
+
         self.chrm = chrm
+        self.chrom = chrom
         self.beg = p - 1000
         self.end = p + 1000
-        global refgenome
-        self.seq = refgenome.fetch_sequence(self.chrm, self.beg, self.end)
-        if len(self.seq) != 2001:
-            raise WrongReferenceError("Invalid_position_%d_(expect_from_0_to_%d_at_%s)" % (p, refgenome.chrm2len(self.chrm), self.chrm))
+        self.wi = None
 
     def get_base(self, chrm, p):
 
         if chrm != self.chrm or p <= self.beg or p >= self.end:
             self.reset(chrm, p)
 
-        return self.seq[p-self.beg]
+        i = (p-1)//WINDOW
+        if i != self.wi:
+            self.wi = i
+            self.wseq = window_cache.window(self.chrom, i)
+        return self.wseq[p-1-i*WINDOW]
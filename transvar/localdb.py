@@ -33,9 +33,15 @@ import sys
 import re, os
 from .utils import *
 from .transcripts import *
-from pickle import load, dump
+from pickle import load
 from . import faidx
 from . import tabix
+from .binstore import TranscriptStore, write_store
+from .seqstore import SeqStore, write_seq_store
+from .snvtable import SNVTable, write_snv_table
+from .nameindex import open_name_index, write_name_index, name_index_bytes
+from .tcache import canonical
+from .locindex import LocIndex, NearestIndex, write_nearest_index
 import subprocess
 
 ## tabix and bgzip is now a dependency, but only when featuredb and indexing is used
@@ -58,6 +64,9 @@ class TransVarDB():
     """ hold transcripts and genes
     In TransVar, transcripts are indexed in two ways to allow both access from name and from coordinates.
     *.transvardb is ordered by gene name and index contains location to the first item
+    *.transvardb.trxn_bin holds the same transcripts as binary records (optional)
+    *.transvardb.cds_seq holds their coding sequences and proteins (optional)
+    *.transvardb.snv_tab holds the coding SNVs of chosen transcripts (optional)
     *.transvardb.loc_idx is a bed-like file ordered by coordinates
     Different from TransVarDB, FeatureDB is only indexed by coordinates.
     """
@@ -72,14 +81,26 @@ class TransVarDB():
         self.dbfn = dbfn
         self.dbfh = open(self.dbfn, 'rt')
 
-        idxfn = dbfn+'.gene_idx'
-        self.gene_idx = load(open(idxfn, 'rb'))
-
-        idxfn = dbfn+'.trxn_idx'
-        self.trnx_idx = load(open(idxfn, 'rb'))
+        # name indices are looked up in place, not loaded
+        self.gene_idx = open_name_index(dbfn+'.gene_idx')
+        self.trnx_idx = open_name_index(dbfn+'.trxn_idx')
+
+        # binary transcript store and nearest-transcript index,
+        # absent in databases indexed by older versions
+        self.store = None
+        self.near_idx = None
+        if os.path.exists(dbfn+'.trxn_bin'):
+            self.store = TranscriptStore(dbfn+'.trxn_bin')
+            if os.path.exists(dbfn+'.near_idx'):
+                self.near_idx = NearestIndex(dbfn+'.near_idx')
+            if os.path.exists(dbfn+'.cds_seq'):
+                self.store.seq_store = SeqStore(dbfn+'.cds_seq')
+            if os.path.exists(dbfn+'.snv_tab'):
+                self.store.snv_table = SNVTable(dbfn+'.snv_tab')
 
         self.alias_idx = None
         self.loc_idx = None
+        self.mem_loc = None     # set by parse_all
         self.source = source
 
     ##########################
@@ -117,16 +138,35 @@ class TransVarDB():
                 t.aliases = fields[11].split(';')
             t.gene_dbxref = fields[12]
             t.source = self.source
-            yield t
+            yield canonical(t)
             if gname is None:
                 break
 
+    def parse_trnx_at(self, pos, gname=None):
+
+        """ transcripts at offset pos of .transvardb
+        read from the binary store when available
+        """
+        if self.store is not None:
+            rid = self.store.rid_at(pos)
+            if rid is not None:
+                if gname is None:
+                    return iter([canonical(self.store.transcript(rid, self.source))])
+                return (canonical(t) for t in self.store.iter_gene(rid, gname, self.source))
+
+        self.dbfh.seek(pos)
+        return self.parse_trnx(gname)
+
     def parse_trnx_loc(self, fields):
 
         """ parse location-indexed transcript file
         .transvardb.loc_idx file
         return only 1 line
         """
+        # the 14th column is the record number in the binary store
+        if self.store is not None and len(fields) > 13:
+            return canonical(self.store.transcript(int(fields[13]), self.source))
+
         t = Transcript()
         t.chrm = fields[0]
         t.beg = int(fields[1])
@@ -143,29 +183,48 @@ class TransVarDB():
             t.aliases = fields[11].split(';')
         t.gene_dbxref = fields[12]
         t.source = self.source
-        return t
+        return canonical(t)
 
-    def parse_all(self, name2gene, name2trnx):
+    def parse_all(self):
 
-        """ parse the whole location-indexed transcript file
-        .transvardb.loc_idx file
-        this is for in-memory processing
+        """ parse the whole name-indexed transcript file
+        .transvardb file (or the binary store)
+        this is for in-memory processing (--mem), after which name and
+        location lookups are answered from memory without tabix
         """
 
-        self.dbfh.seek(0)
-        for line in self.dbfh:
-            fields = line.strip('\n').split('\t')
-            t = parse_trnx_loc(fields)
-            if t.gene_name in name2gene:
-                g = name2gene[t.gene_name]
-            else:
-                g = Gene(t.gene_name)
-                name2gene[t.gene_name] = g
-            g.link_t(t)
-            if t.name not in name2trnx:
-                name2trnx[t.name] = []
-            name2trnx[t.name].append(t)
+        tpts = self.all_transcripts()
+        self.mem_genes = {}
+        self.mem_trnxs = {}
+        for t in tpts:
+            if t.gene_name not in self.mem_genes:
+                self.mem_genes[t.gene_name] = []
+            self.mem_genes[t.gene_name].append(t)
+            if t.name not in self.mem_trnxs:
+                self.mem_trnxs[t.name] = []
+            self.mem_trnxs[t.name].append(t)
+
+        # the same order as .loc_idx
+        self.mem_loc = LocIndex()
+        for t in sorted(tpts, key=lambda t: (t.chrm, t.beg, t.end, t.name)):
+            self.mem_loc.add(t.chrm, t.beg, t.end, t)
+        self.mem_loc.build()
+
+    def all_transcripts(self):
+
+        """ all transcripts in .transvardb order """
+        if self.store is not None:
+            return [self.store.transcript(rid, self.source)
+                    for rid in range(self.store.nrec)]
 
+        self.dbfh.seek(0)
+        tpts = []
+        while True:
+            t = next(self.parse_trnx(), None)
+            if t is None:
+                break
+            tpts.append(t)
+        return tpts
 
     ########################################################
     # retrieve transcripts by gene name or transcript name #
@@ -214,14 +273,23 @@ class TransVarDB():
     def get_by_gene(self, name):
 
         """ get by gene name """
-        if name in self.gene_idx:
-            pos = self.gene_idx[name]
-            self.dbfh.seek(pos)
+        tpts = self.gene_transcripts(name)
+        if tpts is not None:
             g = Gene(name)
-            for t in self.parse_trnx(gname=name):
+            for t in tpts:
                 g.link_t(t)
             yield g
 
+    def gene_transcripts(self, name):
+
+        """ transcripts of gene name, None if no such gene """
+        if self.mem_loc is not None:
+            return self.mem_genes.get(name)
+
+        if name in self.gene_idx:
+            return self.parse_trnx_at(self.gene_idx[name], gname=name)
+        return None
+
     def get_by_trnx(self, name, strictversion = False):
 
         """ read in a gene by transcript name 
@@ -234,14 +302,12 @@ class TransVarDB():
         else:
             version = None # no version info
 
-        if name not in self.trnx_idx:
+        tpts = self.trnx_transcripts(name)
+        if tpts is None:
             return None
 
-        poses = self.trnx_idx[name] # transcript ID might not be unique
         g = None
-        for pos in poses:
-            self.dbfh.seek(pos)
-            t = next(self.parse_trnx(), None)
+        for t in tpts:
 
             if t is None:
                 return None
@@ -257,6 +323,18 @@ class TransVarDB():
 
         return g
 
+    def trnx_transcripts(self, name):
+
+        """ transcripts named name (without version), None if none """
+        if self.mem_loc is not None:
+            return self.mem_trnxs.get(name)
+
+        if name not in self.trnx_idx:
+            return None
+        # transcript ID might not be unique
+        return (next(self.parse_trnx_at(pos), None)
+                for pos in self.trnx_idx[name])
+
     def get_by_alias(self, alias):
 
         """ read a gene by alias of transcripts """
@@ -267,8 +345,7 @@ class TransVarDB():
             poses = self.alias_idx[alias]
             name2gene = {}
             for pos in poses:
-                self.dbfh.seek(pos)
-                t = next(self.parse_trnx(), None)
+                t = next(self.parse_trnx_at(pos), None)
                 if t is None:
                     continue
                 elif t.gene_name in name2gene:
@@ -300,15 +377,29 @@ class TransVarDB():
     def get_by_loc(self, chrm, beg, end=None, flanking=0):
 
         """ get transcript if between begin and end """
-        self._ensure_loc_idx()
         if not end: end = beg
         chrm = normalize_chrm(chrm)
-        for fields in self._iloc_query(chrm,beg-flanking,end+flanking):
-            yield self.parse_trnx_loc(fields)
+        for t in self.loc_transcripts(chrm, beg-flanking, end+flanking):
+            yield t
+
+    def loc_transcripts(self, chrm, beg, end):
+
+        """ transcripts overlapping [beg, end], in .loc_idx order """
+        if self.mem_loc is not None:
+            return self.mem_loc.overlap(chrm, beg, end)
+
+        return (self.parse_trnx_loc(fields)
+                for fields in self._iloc_query(chrm, beg, end))
 
     def get_closest_upstream(self, chrm, pos):
         pos = int(pos)
         chrm = normalize_chrm(chrm)
+        if self.mem_loc is not None:
+            return self.mem_loc.upstream(chrm, pos)
+        if self.near_idx is not None:
+            rid = self.near_idx.upstream(chrm, pos)
+            return None if rid is None else canonical(self.store.transcript(rid, self.source))
+
         s = 50000
         for p in range(pos, -1, -s):
             fs = [f for f in self._iloc_query(chrm, p-s, p) if int(f[2])<pos]
@@ -320,6 +411,12 @@ class TransVarDB():
     def get_closest_downstream(self, chrm, pos):
         pos = int(pos)
         chrm = normalize_chrm(chrm)
+        if self.mem_loc is not None:
+            return self.mem_loc.downstream(chrm, pos)
+        if self.near_idx is not None:
+            rid = self.near_idx.downstream(chrm, pos)
+            return None if rid is None else canonical(self.store.transcript(rid, self.source))
+
         s = 50000
         chrmlen = faidx.refgenome.chrm2len(chrm)
         for p in range(pos, chrmlen, s):
@@ -338,7 +435,7 @@ class TransVarDB():
     # index transcripts from raw files ##
     #####################################
 
-    def index(self, raw_fns):
+    def index(self, raw_fns, sql=False, cds_seq=False, snv_table=None):
 
         # each class that subclassed TransVarDB should have parse_raw
         self.parse_raw(*raw_fns)
@@ -355,12 +452,16 @@ class TransVarDB():
         trnx_idx = {}
         # alias_idx = {}          # hold transcript aliases
         tpts = []
+        entries = []            # for the binary store
+        rids = {}
         for name in names:
             g = self.name2gene[name]
             for t in g.tpts:
                 t.gene_name = g.name
                 tpts.append((t.chrm, t.beg, t.end, t))
                 pos = dbfh.tell()
+                rids[id(t)] = len(entries)
+                entries.append((pos, g.name, g.dbxref, t))
                 if g.name not in gene_idx: # first location, each gene record one position
                     gene_idx[g.name] = pos
 
@@ -379,30 +480,63 @@ class TransVarDB():
                            (g.name, t.name, t.version, t.transcript_type, t.beg, t.end, t.chrm,
                             t.strand, t.cds_beg, t.cds_end, t.exons, ';'.join(t.aliases), g.dbxref))
 
+        dbfh.close()
+
+        ############################################
+        ## .trxn_bin - binary transcript records
+        ############################################
+        write_store(dbfn+'.trxn_bin', entries)
+
+        ############################################
+        ## .cds_seq - coding sequences and proteins
+        ## of the records in .trxn_bin (--cds-seq)
+        ############################################
+        if cds_seq:
+            write_seq_store(dbfn+'.cds_seq', [t for _, _, _, t in entries])
+
+        ############################################
+        ## .snv_tab - coding SNVs of the chosen
+        ## transcripts (--snv-table), snv_table is
+        ## a set of gene or transcript names, or
+        ## True for all protein-coding transcripts
+        ############################################
+        if snv_table:
+            def _chosen_(t):
+                if t.transcript_type != 'protein_coding':
+                    return False
+                return (snv_table is True or t.gene_name in snv_table
+                        or t.name in snv_table)
+            write_snv_table(dbfn+'.snv_tab', [t for _, _, _, t in entries], _chosen_)
+
         ############################################
         ## .gene_idx - index gene name
         ############################################
-        idxfn = dbfn+'.gene_idx'
-        dump(gene_idx, open(idxfn, 'wb'), 2)
+        write_name_index(dbfn+'.gene_idx', gene_idx)
 
         ############################################
         ## .trxn_idx - index transcript name
         ############################################
-        idxfn = dbfn+'.trxn_idx'
-        dump(trnx_idx, open(idxfn, 'wb'), 2)
+        write_name_index(dbfn+'.trxn_idx', trnx_idx)
 
         ############################################
         ## .?.idmap_idx - mappings to gene names
         ## or transcript IDs
         ############################################
         for map_name, mapping in self.idmap.items():
-            idxfn = dbfn + '.' + map_name + '.idmap_idx'
-            dump(mapping, open(idxfn, 'wb'), 2)
+            write_name_index(dbfn + '.' + map_name + '.idmap_idx', mapping)
         
         # if len(alias_idx) > 0:
         #     idxfn = dbfn+'.alias_idx'
         #     dump(alias_idx, open(idxfn, 'wb'), 2)
 
+        ############################################
+        ## .sqlite - all of the above in one
+        ## SQLite database (--sql)
+        ############################################
+        if sql:
+            from .sqldb import write_sqlite
+            write_sqlite(dbfn+'.sqlite', entries, self.idmap)
+
         ############################################
         ## .loc_idx - tab-index genomic locations
         ############################################
@@ -410,9 +544,16 @@ class TransVarDB():
         tpts.sort()
         s = ''
         for chrm, beg, end, t in tpts:
-            s += '%s\t%d\t%d\t%s\t%s\t%d\t%s\t%s\t%d\t%d\t%s\t%s\t%s\n' % (
+            s += '%s\t%d\t%d\t%s\t%s\t%d\t%s\t%s\t%d\t%d\t%s\t%s\t%s\t%d\n' % (
                 t.chrm, t.beg, t.end, t.gene_name, t.name, t.version, t.transcript_type,
-                t.strand, t.cds_beg, t.cds_end, t.exons, ';'.join(t.aliases), t.gene.dbxref)
+                t.strand, t.cds_beg, t.cds_end, t.exons, ';'.join(t.aliases), t.gene.dbxref,
+                rids[id(t)])
+
+        ############################################
+        ## .near_idx - closest transcripts
+        ############################################
+        write_nearest_index(dbfn+'.near_idx',
+                            [(t.chrm, t.beg, t.end, rids[id(t)]) for chrm, beg, end, t in tpts])
 
         ## call external tabix
         with open(idxfn, 'wb') as fh:
@@ -528,7 +669,7 @@ def index_idmap(idmap_fn, idx_fh):
         fields = line.strip('\n').split('\t')
         mapping_append(idmap, fields[0], fields[1])
 
-    dump(idmap, idx_fh, 2)
+    idx_fh.write(name_index_bytes(idmap))
 
     return
 
@@ -1163,34 +1304,67 @@ def main_index(args):
     3) reference;
     4) alias to gene/transcripts
     """
+    # references, first so that --cds-seq can read from them
+    if args.reference and args.reference != "_DEF_":
+        from . import config
+        config.samtools_faidx(args.reference)
+        if args.twobit:
+            from .twobit import write_twobit
+            rg = faidx.RefGenome(args.reference)
+            rg.twobit = None    # pack from the FASTA itself
+            write_twobit(rg, args.reference+'.tv2bit')
+
+    # transcripts chosen for the SNV table, all protein-coding
+    # transcripts unless a file of gene or transcript names is given
+    snv_table = None
+    if args.snv_table == '_ALL_':
+        snv_table = True
+    elif args.snv_table:
+        snv_table = set()
+        for line in opengz(args.snv_table):
+            fields = line.split()
+            if fields and not fields[0].startswith('#'):
+                snv_table.add(fields[0])
+
+    # coding sequences are taken from --reference or the configured
+    # reference of --refversion
+    if args.cds_seq or snv_table:
+        import copy
+        from . import config
+        _args = copy.copy(args)
+        replace_defaults(_args, config.read_config())
+        if not _args.reference or not os.path.exists(_args.reference):
+            err_die("--cds-seq and --snv-table need a reference, please provide it through --reference.")
+        faidx.init_refgenome(_args.reference)
+
     # gene / transcripts
     if args.ensembl:
         db = EnsemblDB()
-        db.index([args.ensembl])
+        db.index([args.ensembl], sql=args.sql, cds_seq=args.cds_seq, snv_table=snv_table)
 
     if args.ccds:
         db = CCDSDB()
-        db.index([args.ccds])
+        db.index([args.ccds], sql=args.sql, cds_seq=args.cds_seq, snv_table=snv_table)
 
     if args.refseq:
         db = RefSeqDB()
-        db.index([args.refseq])
+        db.index([args.refseq], sql=args.sql, cds_seq=args.cds_seq, snv_table=snv_table)
 
     if args.aceview:
         db = AceViewDB()
-        db.index([args.aceview])
+        db.index([args.aceview], sql=args.sql, cds_seq=args.cds_seq, snv_table=snv_table)
 
     if args.gencode:
         db = GENCODEDB()
-        db.index([args.gencode])
+        db.index([args.gencode], sql=args.sql, cds_seq=args.cds_seq, snv_table=snv_table)
 
     if args.kg:
         db = UCSCKnownGeneDB()
-        db.index([args.kg, args.alias])
+        db.index([args.kg, args.alias], sql=args.sql, cds_seq=args.cds_seq, snv_table=snv_table)
 
     if args.ucsc:
         db = UCSCRefGeneDB()
-        db.index([args.ucsc])
+        db.index([args.ucsc], sql=args.sql, cds_seq=args.cds_seq, snv_table=snv_table)
 
     # features
     if args.gff:
@@ -1221,10 +1395,6 @@ def main_index(args):
     #     uniprot2multi_ids = parser.parse_uniprot_mapping(args.uniprot)
     #     dump(uniprot2multi_ids, open(args.uniprot+'.idx','wb'), 2)
 
-    # references
-    if args.reference and args.reference != "_DEF_":
-        from . import config
-        config.samtools_faidx(args.reference)
 
 def main():
 
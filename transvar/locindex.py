@@ -0,0 +1,354 @@
+"""
+The MIT License
+
+Copyright (c) 2015
+The University of Texas MD Anderson Cancer Center
+Wanding Zhou, Tenghui Chen, Ken Chen (kchen3@mdanderson.org)
+
+Permission is hereby granted, free of charge, to any person obtaining
+a copy of this software and associated documentation files (the
+"Software"), to deal in the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+
+## in-memory location index
+##
+## Items (transcripts) are kept per chromosome in sorted arrays. The
+## query semantics follow those of tabix on the .loc_idx file, so that
+## results and their order are identical to the tabix lookups:
+##   overlap(chrm, beg, end)   items with item.beg < end and
+##                             item.end >= max(0, beg), in file order,
+##                             nothing when end <= beg-1
+##   upstream(chrm, pos)       the item with the largest end < pos
+##   downstream(chrm, pos)     the item with the smallest beg > pos
+## ties are resolved by file order, i.e., (beg, end, name).
+
+import os
+import struct
+from array import array
+from bisect import bisect_left, bisect_right
+
+def prefix_max(ends):
+    """ prefix maximum of ends, for the left bound of overlaps """
+    maxends = []
+    m = -1
+    for e in ends:
+        m = max(m, e)
+        maxends.append(m)
+    return maxends
+
+def overlap_indices(begs, ends, maxends, beg, end):
+    """ indices of the items overlapping [beg, end], tabix semantics """
+    beg = max(0, beg)
+    if end <= max(0, beg-1):    # empty region for tabix
+        return []
+    hi = bisect_left(begs, end)
+    lo = bisect_left(maxends, beg, 0, hi)
+    return [i for i in range(lo, hi) if ends[i] >= beg]
+
+class _ChrmIndex():
+
+    def __init__(self, items):
+
+        # items are (beg, end, item) in file order
+        self.begs = [b for b, e, it in items]
+        self.ends = [e for b, e, it in items]
+        self.items = [it for b, e, it in items]
+
+        self.maxends = prefix_max(self.ends)
+
+        # ends in ascending order, ties in file order
+        order = sorted(range(len(items)), key=lambda i: self.ends[i])
+        self.sorted_ends = [self.ends[i] for i in order]
+        self.end_order = order
+
+    def overlap(self, beg, end):
+        return [self.items[i] for i in overlap_indices(
+            self.begs, self.ends, self.maxends, beg, end)]
+
+    def upstream(self, pos):
+        i = bisect_left(self.sorted_ends, pos)
+        if i == 0:
+            return None
+        i = bisect_left(self.sorted_ends, self.sorted_ends[i-1])
+        return self.items[self.end_order[i]]
+
+    def downstream(self, pos):
+        i = bisect_right(self.begs, pos)
+        if i == len(self.begs):
+            return None
+        return self.items[i]
+
+class LocIndex():
+
+    def __init__(self):
+        self.chrm2items = {}
+        self.chrm2index = {}
+
+    def add(self, chrm, beg, end, item):
+        """ add items in file order, i.e., sorted by (beg, end, name) """
+        if chrm not in self.chrm2items:
+            self.chrm2items[chrm] = []
+        self.chrm2items[chrm].append((beg, end, item))
+
+    def build(self):
+        for chrm, items in self.chrm2items.items():
+            # stable, keeps file order within the same begin
+            items.sort(key=lambda x: x[0])
+            self.chrm2index[chrm] = _ChrmIndex(items)
+        self.chrm2items = {}
+
+    def overlap(self, chrm, beg, end):
+        if chrm not in self.chrm2index:
+            return []
+        return self.chrm2index[chrm].overlap(beg, end)
+
+    def upstream(self, chrm, pos):
+        if chrm not in self.chrm2index:
+            return None
+        return self.chrm2index[chrm].upstream(pos)
+
+    def downstream(self, chrm, pos):
+        if chrm not in self.chrm2index:
+            return None
+        return self.chrm2index[chrm].downstream(pos)
+
+## per-chromosome int32 arrays on disk
+##
+## layout (little endian):
+##   magic, number of chromosomes
+##   per chromosome: name length, name, number of items n,
+##                   offset of the arrays, each n int32
+## a chromosome's arrays are read on first use.
+
+def _int32_array_(b):
+    a = array('i')
+    if hasattr(a, 'frombytes'):
+        a.frombytes(b)
+    else:
+        a.fromstring(b)
+    return a
+
+def _int32_bytes_(l):
+    a = array('i', l)
+    if hasattr(a, 'tobytes'):
+        return a.tobytes()
+    return a.tostring()
+
+def write_chrm_arrays(fn, magic, chrm2arrays):
+
+    chrms = sorted(chrm2arrays.keys())
+    blocks = []
+    for chrm in chrms:
+        arrays = chrm2arrays[chrm]
+        blocks.append((chrm, len(arrays[0]),
+                       b''.join([_int32_bytes_(a) for a in arrays])))
+
+    hsize = len(magic) + 4
+    for chrm, n, data in blocks:
+        hsize += 4 + len(chrm.encode('utf-8')) + 4 + 8
+    header = [magic, struct.pack('<I', len(chrms))]
+    offset = hsize
+    for chrm, n, data in blocks:
+        name = chrm.encode('utf-8')
+        header.append(struct.pack('<I', len(name)) + name + struct.pack('<IQ', n, offset))
+        offset += len(data)
+
+    # write to a temporary file first, concurrent readers
+    # only ever see a complete file
+    tmpfn = '%s.%d.tmp' % (fn, os.getpid())
+    try:
+        with open(tmpfn, 'wb') as fh:
+            fh.write(b''.join(header))
+            for chrm, n, data in blocks:
+                fh.write(data)
+        os.rename(tmpfn, fn)
+    except (IOError, OSError):
+        if os.path.exists(tmpfn):
+            os.remove(tmpfn)
+        raise
+
+def remove_stale_files(prefix, suffix):
+
+    """ remove the files named <prefix>*<suffix>, left by earlier
+    versions of an index, as far as permitted """
+    dirname, basename = os.path.split(os.path.abspath(prefix))
+    try:
+        fns = os.listdir(dirname)
+    except OSError:
+        return
+    for fn in fns:
+        if fn.startswith(basename) and fn.endswith(suffix):
+            try:
+                os.remove(os.path.join(dirname, fn))
+            except OSError:
+                pass
+
+class ChrmArrays():
+
+    def __init__(self, fn, magic, narrays):
+
+        self.narrays = narrays
+        self.fh = open(fn, 'rb')
+        if self.fh.read(len(magic)) != magic:
+            raise ValueError('%s is not a valid index, consider rerunning transvar index' % fn)
+        self.chrm2loc = {}
+        nchrm, = struct.unpack('<I', self.fh.read(4))
+        for i in range(nchrm):
+            l, = struct.unpack('<I', self.fh.read(4))
+            chrm = self.fh.read(l).decode('utf-8')
+            self.chrm2loc[chrm] = struct.unpack('<IQ', self.fh.read(12))
+        self.chrm2arrays = {}
+
+    def get(self, chrm):
+        if chrm not in self.chrm2arrays:
+            if chrm not in self.chrm2loc:
+                return None
+            n, offset = self.chrm2loc[chrm]
+            self.fh.seek(offset)
+            a = _int32_array_(self.fh.read(4*self.narrays*n))
+            self.chrm2arrays[chrm] = [a[i*n:(i+1)*n] for i in range(self.narrays)]
+        return self.chrm2arrays[chrm]
+
+## nearest-transcript index (.transvardb.near_idx)
+##
+## For each chromosome, the sorted begins and ends of the transcripts
+## with their record numbers in the binary transcript store, so the
+## closest transcripts upstream and downstream of a position are found
+## by one binary search. Written by "transvar index".
+
+NEAR_MAGIC = b'TVNEAR01'
+
+def write_nearest_index(fn, entries):
+
+    """ entries: (chrm, beg, end, rid) in .loc_idx order """
+
+    chrm2entries = {}
+    for chrm, beg, end, rid in entries:
+        if chrm not in chrm2entries:
+            chrm2entries[chrm] = []
+        chrm2entries[chrm].append((beg, end, rid))
+
+    chrm2arrays = {}
+    for chrm, es in chrm2entries.items():
+        by_beg = sorted(es, key=lambda x: x[0])  # stable, ties in file order
+        by_end = sorted(es, key=lambda x: x[1])
+        chrm2arrays[chrm] = ([x[0] for x in by_beg], [x[2] for x in by_beg],
+                             [x[1] for x in by_end], [x[2] for x in by_end])
+
+    write_chrm_arrays(fn, NEAR_MAGIC, chrm2arrays)
+
+class NearestIndex():
+
+    def __init__(self, fn):
+        self.arrays = ChrmArrays(fn, NEAR_MAGIC, 4)
+
+    def upstream(self, chrm, pos):
+
+        """ record number of the transcript with the largest end < pos """
+        arrays = self.arrays.get(chrm)
+        if arrays is None:
+            return None
+        begs, beg_rids, ends, end_rids = arrays
+        i = bisect_left(ends, pos)
+        if i == 0:
+            return None
+        return end_rids[bisect_left(ends, ends[i-1])]
+
+    def downstream(self, chrm, pos):
+
+        """ record number of the transcript with the smallest beg > pos """
+        arrays = self.arrays.get(chrm)
+        if arrays is None:
+            return None
+        begs, beg_rids, ends, end_rids = arrays
+        i = bisect_right(begs, pos)
+        if i == len(begs):
+            return None
+        return beg_rids[i]
+
+## merged location index over several transcript databases
+##
+## Instead of one tabix query per source, the transcripts of all
+## sources are put in one per-chromosome array sorted by
+## (beg, end, name, source, record number), built once for a set of
+## sources and cached on disk. A query returns (source index, record
+## number) pairs ordered by source and, within a source, in .loc_idx
+## order, i.e., the order of querying the sources one after another.
+## Where the cache cannot be written, the index is kept in memory.
+
+MERGED_MAGIC = b'TVMLOC01'
+
+def merged_loc_arrays(stores):
+
+    """ per-chromosome arrays (begs, ends, maxends, sources, rids) from
+    the binary transcript stores of the sources, in source order """
+
+    chrm2entries = {}
+    for si, store in enumerate(stores):
+        for rid in range(store.nrec):
+            chrm, beg, end, name = store.location(rid)
+            if chrm not in chrm2entries:
+                chrm2entries[chrm] = []
+            chrm2entries[chrm].append((beg, end, name, si, rid))
+
+    chrm2arrays = {}
+    for chrm, entries in chrm2entries.items():
+        entries.sort()
+        ends = [e[1] for e in entries]
+        chrm2arrays[chrm] = ([e[0] for e in entries], ends, prefix_max(ends),
+                             [e[3] for e in entries], [e[4] for e in entries])
+
+    return chrm2arrays
+
+class MergedLocIndex():
+
+    def __init__(self, fn, stores):
+
+        self.arrays = None
+        if os.path.exists(fn):
+            try:
+                self.arrays = ChrmArrays(fn, MERGED_MAGIC, 5)
+                return
+            except (IOError, OSError, ValueError, struct.error):
+                pass            # unreadable or broken, rebuild
+
+        self.chrm2arrays = merged_loc_arrays(stores)
+        if os.access(os.path.dirname(os.path.abspath(fn)), os.W_OK):
+            try:
+                write_chrm_arrays(fn, MERGED_MAGIC, self.chrm2arrays)
+            except (IOError, OSError):
+                pass
+        # otherwise (not writable) the index is kept in memory only
+
+    def overlap(self, chrm, beg, end):
+
+        """ (source index, record number) of the overlapping transcripts """
+        if self.arrays is None:
+            arrays = self.chrm2arrays.get(chrm)
+        else:
+            arrays = self.arrays.get(chrm)
+        if arrays is None:
+            return []
+
+        begs, ends, maxends, sources, rids = arrays
+        hits = [(sources[i], rids[i])
+                for i in overlap_indices(begs, ends, maxends, beg, end)]
+        hits.sort(key=lambda h: h[0])  # stable, keeps .loc_idx order within a source
+        return hits
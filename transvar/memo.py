@@ -0,0 +1,87 @@
+"""
+The MIT License
+
+Copyright (c) 2015
+The University of Texas MD Anderson Cancer Center
+Wanding Zhou, Tenghui Chen, Ken Chen (kchen3@mdanderson.org)
+
+Permission is hereby granted, free of charge, to any person obtaining
+a copy of this software and associated documentation files (the
+"Software"), to deal in the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+
+## memo of annotation output for repeated queries
+##
+## Cohort inputs repeat the same variant many times. The output of a
+## query only depends on the parsed query (and the run-wide options),
+## so it is annotated once, with an empty output prefix, and the text
+## is replayed with the input prefix of later occurrences. The memo is
+## a bounded LRU keyed on the normalized query.
+
+from collections import OrderedDict
+from .record import Pos
+from .err import err_print
+
+def query_key(q, at):
+
+    """ hashable key from the query type, token, coordinates and alleles
+    (including the transcript filter), ignoring the input string """
+    items = []
+    for k, v in sorted(vars(q).items()):
+        if k in ('op', 'msg', 'gene'):
+            continue
+        if isinstance(v, Pos):
+            v = ('Pos', v.pos, v.tpos)
+        elif not isinstance(v, (str, int, float, bool, type(None))):
+            v = repr(v)
+        items.append((k, v))
+
+    return (at, q.__class__.__name__, tuple(items))
+
+class QueryMemo(object):
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        text = self.cache.pop(key, None)
+        if text is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.cache[key] = text  # most recently used
+        return text
+
+    def put(self, key, text):
+        self.cache[key] = text
+        if len(self.cache) > self.maxsize:
+            self.cache.popitem(last=False)
+
+def report(stats):
+
+    """ print the hit rate, stats is a list of (hits, misses) """
+    hits = sum(h for h, m in stats)
+    total = hits + sum(m for h, m in stats)
+    if total > 0:
+        err_print('query cache: %d of %d queries replayed (%1.1f%% hit rate)' %
+                  (hits, total, 100.0*hits/total))
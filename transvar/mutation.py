@@ -31,6 +31,7 @@ import re, sys, argparse
 from .utils import *
 from .record import *
 from .err import *
+from . import output
 
 def _parse_gdna_mutation(s):
 
@@ -375,10 +376,10 @@ def vcf_parse_mutation(args, at='g'):
         nrec += 1
 
         if line.startswith('##'):
-            sys.stdout.write(line)
+            output.write(line)
             continue
         if line.startswith('#CHROM'):
-            sys.stdout.write(line.strip()+'\t'+print_header_s()+'\n')
+            output.write_line(line.strip()+'\t'+print_header_s())
             continue
 
         fields = line.strip().split('\t')
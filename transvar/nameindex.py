@@ -0,0 +1,186 @@
+"""
+The MIT License
+
+Copyright (c) 2015
+The University of Texas MD Anderson Cancer Center
+Wanding Zhou, Tenghui Chen, Ken Chen (kchen3@mdanderson.org)
+
+Permission is hereby granted, free of charge, to any person obtaining
+a copy of this software and associated documentation files (the
+"Software"), to deal in the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+
+## memory-mapped name index (.gene_idx, .trxn_idx, .idmap_idx)
+##
+## A sorted-key table read in place: a lookup is a binary search over
+## the keys and touches only the pages it compares, so opening a
+## database no longer unpickles every name up front. Files written by
+## older versions are pickled dicts and are still read as such.
+##
+## layout (little endian):
+##   header        magic, value kind (integers or strings), whether a
+##                 key has one value or a list, number of keys and
+##                 values, and the offsets of the sections below
+##   key pointers  uint64 (nkeys+1) offsets into the key blob
+##   key blob      utf-8 keys, in ascending byte order
+##   value ptrs    uint64 (nkeys+1) index of the first value of a key
+##   values        int64 values, or uint64 (nvals+1) offsets into
+##                 the value blob followed by the utf-8 blob
+
+import struct
+import mmap
+from numbers import Integral
+from pickle import load
+
+MAGIC = b'TVNAME01'
+HEADER = struct.Struct('<8sBB6xQQQQQQQ')
+VALUE_INT = 0
+VALUE_STR = 1
+U64 = struct.Struct('<Q')
+I64 = struct.Struct('<q')
+
+def _values_(v):
+    """ values of a key as a list, sets are sorted """
+    if isinstance(v, (list, tuple)):
+        return list(v)
+    if isinstance(v, (set, frozenset)):
+        return sorted(v)
+    return [v]
+
+def name_index_bytes(mapping):
+
+    """ serialize mapping, {name: value or list/set of values}, the
+    values are either all integers or all strings """
+    keys = sorted(mapping, key=lambda k: k.encode('utf-8'))
+    multi = any(isinstance(v, (list, tuple, set, frozenset)) for v in mapping.values())
+    values = []
+    val_ptrs = [0]
+    for k in keys:
+        values.extend(_values_(mapping[k]))
+        val_ptrs.append(len(values))
+    kind = VALUE_INT
+    if any(not isinstance(v, Integral) for v in values):
+        kind = VALUE_STR
+
+    key_blob = []
+    key_ptrs = [0]
+    for k in keys:
+        key_blob.append(k.encode('utf-8'))
+        key_ptrs.append(key_ptrs[-1]+len(key_blob[-1]))
+    key_blob = b''.join(key_blob)
+
+    if kind == VALUE_INT:
+        vals = struct.pack('<%dq' % len(values), *values)
+        val_blob = b''
+    else:
+        encoded = [v.encode('utf-8') for v in values]
+        offs = [0]
+        for v in encoded:
+            offs.append(offs[-1]+len(v))
+        vals = struct.pack('<%dQ' % len(offs), *offs)
+        val_blob = b''.join(encoded)
+
+    key_ptr_off = HEADER.size
+    key_blob_off = key_ptr_off + U64.size*len(key_ptrs)
+    val_ptr_off = key_blob_off + len(key_blob)
+    vals_off = val_ptr_off + U64.size*len(val_ptrs)
+    val_blob_off = vals_off + len(vals)
+
+    return b''.join([
+        HEADER.pack(MAGIC, kind, int(multi), len(keys), len(values),
+                    key_ptr_off, key_blob_off, val_ptr_off, vals_off, val_blob_off),
+        struct.pack('<%dQ' % len(key_ptrs), *key_ptrs), key_blob,
+        struct.pack('<%dQ' % len(val_ptrs), *val_ptrs), vals, val_blob])
+
+def write_name_index(fn, mapping):
+    with open(fn, 'wb') as fh:
+        fh.write(name_index_bytes(mapping))
+
+class NameIndex():
+
+    """ read-only mapping over a name index file, looked up in place """
+
+    def __init__(self, fn):
+
+        with open(fn, 'rb') as fh:
+            self.mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.kind, self.multi, self.nkeys, self.nvals,
+         self.key_ptr_off, self.key_blob_off, self.val_ptr_off,
+         self.vals_off, self.val_blob_off) = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            raise ValueError('%s is not a name index' % fn)
+
+    def _ptr_(self, off, i):
+        return U64.unpack_from(self.mm, off+U64.size*i)[0]
+
+    def _key_(self, i):
+        return self.mm[self.key_blob_off+self._ptr_(self.key_ptr_off, i):
+                       self.key_blob_off+self._ptr_(self.key_ptr_off, i+1)]
+
+    def _find_(self, key):
+        """ position of key, -1 if absent """
+        k = key.encode('utf-8')
+        lo, hi = 0, self.nkeys
+        while lo < hi:
+            mid = (lo+hi)//2
+            if self._key_(mid) < k:
+                lo = mid+1
+            else:
+                hi = mid
+        if lo < self.nkeys and self._key_(lo) == k:
+            return lo
+        return -1
+
+    def _value_(self, j):
+        if self.kind == VALUE_INT:
+            return I64.unpack_from(self.mm, self.vals_off+I64.size*j)[0]
+        return self.mm[self.val_blob_off+self._ptr_(self.vals_off, j):
+                       self.val_blob_off+self._ptr_(self.vals_off, j+1)].decode('utf-8')
+
+    def __len__(self):
+        return self.nkeys
+
+    def __contains__(self, key):
+        return self._find_(key) >= 0
+
+    def __getitem__(self, key):
+        i = self._find_(key)
+        if i < 0:
+            raise KeyError(key)
+        values = [self._value_(j) for j in range(
+            self._ptr_(self.val_ptr_off, i), self._ptr_(self.val_ptr_off, i+1))]
+        if self.multi:
+            return values
+        return values[0]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+def open_name_index(fn):
+
+    """ a name index file, or the pickled dict written by older versions """
+    with open(fn, 'rb') as fh:
+        if fh.read(len(MAGIC)) == MAGIC:
+            return NameIndex(fn)
+        fh.seek(0)
+        return load(fh)
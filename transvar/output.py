@@ -0,0 +1,147 @@
+"""
+The MIT License
+
+Copyright (c) 2015
+The University of Texas MD Anderson Cancer Center
+Wanding Zhou, Tenghui Chen, Ken Chen (kchen3@mdanderson.org)
+
+Permission is hereby granted, free of charge, to any person obtaining
+a copy of this software and associated documentation files (the
+"Software"), to deal in the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+
+## buffered output
+##
+## All annotation output goes through the current OutputSink rather
+## than print(). The sink collects lines in memory and writes them to
+## the underlying file in large chunks. Flush policy:
+##   - whenever more than bufsize characters are buffered,
+##   - after each query when line_buffered is set (interactive use),
+##   - when the sink is closed at the end of a run.
+## Without an open sink (e.g., when used as a library) lines are
+## written to sys.stdout directly.
+
+import sys
+from contextlib import contextmanager
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+class OutputSink(object):
+
+    def __init__(self, fh, bufsize=1<<20, line_buffered=False):
+        self.fh = fh
+        self.bufsize = bufsize
+        self.line_buffered = line_buffered
+        self.buf = []
+        self.size = 0
+
+    def write(self, s):
+        self.buf.append(s)
+        self.size += len(s)
+        if self.size >= self.bufsize:
+            self.flush()
+
+    def write_line(self, s):
+        self.write(s+'\n')
+
+    def end_query(self):
+        if self.line_buffered:
+            self.flush()
+
+    def flush(self):
+        if self.buf:
+            s = ''.join(self.buf)
+            self.buf = []
+            self.size = 0
+            try:
+                self.fh.write(s)
+                if self.line_buffered:
+                    self.fh.flush()
+            except IOError:     # e.g., broken pipe
+                sys.exit(1)
+
+    def close(self):
+        self.flush()
+        try:
+            self.fh.flush()
+        except IOError:
+            sys.exit(1)
+        if self.fh is not sys.stdout:
+            self.fh.close()
+
+# the sink all output is written to, set by open_sink()
+sink = None
+
+def current():
+    return sink
+
+def write(s):
+    if sink is None:
+        try:
+            sys.stdout.write(s)
+        except IOError:
+            sys.exit(1)
+    else:
+        sink.write(s)
+
+def write_line(s):
+    write(s+'\n')
+
+def end_query():
+    if sink is not None:
+        sink.end_query()
+
+def open_sink(args):
+
+    """ set up the output sink from -O, --output-buffer and --line-buffered """
+    global sink
+    outfn = getattr(args, 'O', None)
+    fh = open(outfn, 'w') if outfn else sys.stdout
+    sink = OutputSink(fh,
+                      bufsize=getattr(args, 'output_buffer', 1<<20),
+                      line_buffered=getattr(args, 'line_buffered', False))
+    return sink
+
+def close_sink():
+    global sink
+    if sink is not None:
+        s = sink
+        sink = None
+        s.close()
+
+@contextmanager
+def capture():
+
+    """ collect the output written within the block in memory
+    with capture() as buf:
+        ...
+    text = buf.getvalue()
+    """
+    global sink
+    saved = sink
+    buf = StringIO()
+    sink = OutputSink(buf)
+    try:
+        yield buf
+    finally:
+        sink.flush()
+        sink = saved
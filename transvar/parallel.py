@@ -0,0 +1,131 @@
+"""
+The MIT License
+
+Copyright (c) 2015
+The University of Texas MD Anderson Cancer Center
+Wanding Zhou, Tenghui Chen, Ken Chen (kchen3@mdanderson.org)
+
+Permission is hereby granted, free of charge, to any person obtaining
+a copy of this software and associated documentation files (the
+"Software"), to deal in the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+
+## multi-process annotation of query lists
+##
+## Queries are read by the parent process and shipped to a pool of
+## workers in batches. Each worker opens its own AnnoDB (and hence its
+## own reference mmap and tabix handles), annotates the batch into a
+## string buffer and returns the text. The parent writes the buffers
+## back in submission order so the output is identical to a serial run.
+
+import os
+import multiprocessing
+from collections import deque
+from copy import copy
+
+from .annodb import AnnoDB
+from . import output
+from .config import read_config
+from . import anno
+from .memo import QueryMemo, report as report_memo
+
+# per-process worker state, set up by _init_worker_
+_worker_ = {}
+
+def _init_worker_(args, at):
+
+    _worker_['args'] = args
+    _worker_['at'] = at
+    _worker_['db'] = AnnoDB(args, read_config())
+    _worker_['memo'] = QueryMemo(args.memo) if args.memo > 0 else None
+
+def _annotate_batch_(batch):
+
+    """ return the output text and the worker's cumulative memo counts """
+    memo = _worker_['memo']
+    s = anno.annotate_batch(
+        _worker_['args'], _worker_['db'], _worker_['at'], batch, memo)
+    if memo is None:
+        return s, os.getpid(), 0, 0
+    return s, os.getpid(), memo.hits, memo.misses
+
+def _collect_(result, memo_stats):
+
+    s, pid, hits, misses = result
+    memo_stats[pid] = (hits, misses)
+    return s
+
+def iter_batches(mutation_parser, batch_size):
+
+    """ group the queries from a mutation parser into lists """
+    batch = []
+    for q, line in mutation_parser:
+        batch.append(q)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+def annotate_batches_parallel(args, at, batches, memo_stats):
+
+    """ annotate batches with args.jobs worker processes
+    yield the output of each batch in input order
+    memo_stats collects the (hits, misses) of each worker
+    """
+
+    # the list file handle is consumed by the parent only
+    wargs = copy(args)
+    wargs.l = None
+
+    pool = multiprocessing.Pool(args.jobs, _init_worker_, (wargs, at))
+    maxpending = args.jobs * 4  # bound the number of batches in flight
+    pending = deque()
+    try:
+        for batch in batches:
+            pending.append(pool.apply_async(_annotate_batch_, (batch,)))
+            if len(pending) >= maxpending:
+                yield _collect_(pending.popleft().get(), memo_stats)
+
+        while pending:
+            yield _collect_(pending.popleft().get(), memo_stats)
+
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+def main_list_parallel(args, at, mutation_parser):
+
+    """ annotate a list of queries with args.jobs worker processes
+    results are written in input order
+    """
+    memo_stats = {}
+    for s in annotate_batches_parallel(
+            args, at, iter_batches(mutation_parser, anno.list_batch_size(args)),
+            memo_stats):
+        output.write(s)
+        output.end_query()
+
+    if args.memo > 0 and args.verbose > 0:
+        report_memo(memo_stats.values())
@@ -0,0 +1,171 @@
+"""
+The MIT License
+
+Copyright (c) 2015
+The University of Texas MD Anderson Cancer Center
+Wanding Zhou, Tenghui Chen, Ken Chen (kchen3@mdanderson.org)
+
+Permission is hereby granted, free of charge, to any person obtaining
+a copy of this software and associated documentation files (the
+"Software"), to deal in the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+
+## streaming annotation of query lists
+##
+## The list is processed in three stages connected by bounded queues:
+##
+##   parse (thread) -> annotate (main thread) -> write (thread)
+##
+## The parse stage reads and parses input lines into batches of
+## args.batch_size queries, the annotate stage turns each batch into
+## output text (in-process, or through the worker pool when
+## args.jobs > 1) and the write stage sends the text to the output sink.
+## At most args.queue_size batches wait between two stages, a slow
+## consumer blocks the producer in front of it so memory stays bounded
+## regardless of the input size. Output order is the input order.
+
+import sys
+import threading
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+from . import anno
+from . import output
+from .parallel import iter_batches, annotate_batches_parallel
+from .memo import QueryMemo, report as report_memo
+
+# marks the end of the stream in a queue
+_END_ = object()
+
+class Pipeline(object):
+
+    def __init__(self):
+        self.aborted = threading.Event()
+        self.exc_info = None
+
+    def abort(self):
+        if self.exc_info is None:
+            self.exc_info = sys.exc_info()
+        self.aborted.set()
+
+    def put(self, q, item):
+        """ blocking put that gives up once the pipeline is aborted """
+        while not self.aborted.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def get(self, q):
+        """ blocking get that returns _END_ once the pipeline is aborted """
+        while not self.aborted.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return _END_
+
+    def drain(self, q):
+        """ iterate through a queue until the end of the stream """
+        while True:
+            item = self.get(q)
+            if item is _END_:
+                return
+            yield item
+
+    def parse(self, mutation_parser, batch_size, outq):
+        try:
+            for batch in iter_batches(mutation_parser, batch_size):
+                if not self.put(outq, batch):
+                    return
+        except:
+            self.abort()
+        finally:
+            self.put(outq, _END_)
+
+    def write(self, inq, out):
+        try:
+            for s in self.drain(inq):
+                out.write(s)
+                out.end_query()
+            out.flush()
+        except:
+            self.abort()
+
+def _annotate_batches_(args, db, at, batches, memo_stats):
+
+    memo = QueryMemo(args.memo) if args.memo > 0 else None
+    for batch in batches:
+        s = anno.annotate_batch(args, db, at, batch, memo)
+        if memo is not None:
+            memo_stats[0] = (memo.hits, memo.misses)
+        yield s
+
+def main_list_pipeline(args, db, at, mutation_parser):
+
+    """ annotate a list of queries in a parse/annotate/write pipeline """
+
+    pl = Pipeline()
+    parsed = queue.Queue(args.queue_size)
+    formatted = queue.Queue(args.queue_size)
+
+    # the writer keeps its own reference to the output sink, the
+    # annotate stage captures the output while it processes a batch
+    parser = threading.Thread(target=pl.parse,
+                              args=(mutation_parser, anno.list_batch_size(args), parsed))
+    writer = threading.Thread(target=pl.write,
+                              args=(formatted, output.current()))
+    parser.daemon = True
+    writer.daemon = True
+    parser.start()
+    writer.start()
+
+    memo_stats = {}
+    try:
+        batches = pl.drain(parsed)
+        if args.jobs > 1:
+            outputs = annotate_batches_parallel(args, at, batches, memo_stats)
+        else:
+            outputs = _annotate_batches_(args, db, at, batches, memo_stats)
+
+        try:
+            for s in outputs:
+                if not pl.put(formatted, s):
+                    break
+        finally:
+            outputs.close()
+    except:
+        pl.abort()
+    finally:
+        pl.put(formatted, _END_)
+
+    writer.join()
+    parser.join()
+
+    if pl.exc_info is not None:
+        exc_type, exc, tb = pl.exc_info
+        raise exc
+
+    if args.memo > 0 and args.verbose > 0:
+        report_memo(memo_stats.values())
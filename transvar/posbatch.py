@@ -0,0 +1,213 @@
+"""
+The MIT License
+
+Copyright (c) 2015
+The University of Texas MD Anderson Cancer Center
+Wanding Zhou, Tenghui Chen, Ken Chen (kchen3@mdanderson.org)
+
+Permission is hereby granted, free of charge, to any person obtaining
+a copy of this software and associated documentation files (the
+"Software"), to deal in the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+
+## batch position mapping on one transcript
+##
+## gpos2codon and tnuc2gnuc map one position per call. The functions
+## here map a whole array of positions on the same transcript at once,
+## through the coding segments of CodingPositions: a binary search of
+## each position over the segment starts, then arithmetic on the
+## segment offsets. With numpy the searches and the arithmetic are
+## vectorized; without it the same is done one position at a time.
+##
+## Results are the fields gpos2codon would give, as parallel arrays:
+##   cindex   codon index (Codon.index)
+##   coffset  offset of the cDNA base in its codon (0, 1, 2)
+##   pos      cDNA position (Pos.pos)
+##   tpos     offset from the exon boundary (Pos.tpos)
+##   region   one of the REGION_ classes below
+## Only the coding positions are used, the reference is not read.
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .err import IncompatibleTranscriptError
+
+REGION_NONE = -1        # no coding base at or beyond the position
+REGION_CODING = 0
+REGION_INTRONIC = 1
+REGION_5PRIME = 2       # before the CDS start in transcript direction
+REGION_3PRIME = 3       # after the CDS end in transcript direction
+REGION_NAMES = {
+    REGION_NONE: 'Unknown',
+    REGION_CODING: 'Coding',
+    REGION_INTRONIC: 'Intronic',
+    REGION_5PRIME: "5'",
+    REGION_3PRIME: "3'",
+}
+
+def resolve_policy(strand, intronic_policy):
+
+    """ g_smaller/g_greater to c_smaller/c_greater on the strand """
+    if intronic_policy == 'g_greater':
+        return 'c_greater' if strand == '+' else 'c_smaller'
+    if intronic_policy == 'g_smaller':
+        return 'c_smaller' if strand == '+' else 'c_greater'
+    if intronic_policy not in ('closer', 'c_smaller', 'c_greater'):
+        raise Exception('unknown_intronic_policy')
+    return intronic_policy
+
+def _gpos2codon_one_(t, cp, gpos, policy):
+
+    """ (cindex, pos, tpos, region) of one genomic position """
+    n = len(cp)
+    if gpos < t.cds_beg:
+        if cp.sign == 1:
+            return 1, 1, gpos-t.cds_beg, REGION_5PRIME
+        return (n+2)//3, n, t.cds_beg-gpos, REGION_3PRIME
+    if gpos > t.cds_end:
+        if cp.sign == 1:
+            return (n+2)//3, n, gpos-t.cds_end, REGION_3PRIME
+        return 1, 1, t.cds_end-gpos, REGION_5PRIME
+
+    i = cp.search(gpos)
+    if i >= n:
+        return 0, 0, 0, REGION_NONE
+    p = cp[i]
+    if p == gpos:
+        return i//3+1, i+1, 0, REGION_CODING
+
+    # distances to the flanking coding bases, along the transcript
+    d_prev = cp.sign*(gpos-cp[i-1])
+    d_next = cp.sign*(p-gpos)
+    if policy == 'c_smaller' or (policy == 'closer' and d_prev < d_next):
+        return i//3+1, i, d_prev, REGION_INTRONIC
+    return (i+1)//3+1, i+1, -d_next, REGION_INTRONIC
+
+def gpos2codon_batch(t, gposes, intronic_policy='closer'):
+
+    """ map genomic positions on transcript t as gpos2codon does
+    return (cindex, coffset, pos, tpos, region), numpy arrays when
+    numpy is available, lists otherwise """
+
+    cp = t.coding_positions()
+    policy = resolve_policy(t.strand, intronic_policy)
+    if numpy is None or not cp.ordered or len(cp) == 0:
+        rs = [_gpos2codon_one_(t, cp, int(g), policy) for g in gposes]
+        cindex = [r[0] for r in rs]
+        pos = [r[1] for r in rs]
+        tpos = [r[2] for r in rs]
+        region = [r[3] for r in rs]
+        coffset = [(p-1)%3 if p > 0 else 0 for p in pos]
+        if numpy is not None:
+            return tuple(numpy.asarray(a, dtype=numpy.int64)
+                         for a in (cindex, coffset, pos, tpos, region))
+        return cindex, coffset, pos, tpos, region
+
+    g = numpy.asarray(gposes, dtype=numpy.int64)
+    n = len(cp)
+    sign = cp.sign
+    keys = numpy.asarray(cp.keys, dtype=numpy.int64)
+    starts = numpy.asarray(cp.starts, dtype=numpy.int64)
+    offs = numpy.asarray(cp.offs, dtype=numpy.int64)
+    seglens = numpy.diff(numpy.append(offs, n))
+
+    def _at_(i):
+        k = numpy.searchsorted(offs, i, side='right')-1
+        return starts[k] + sign*(i-offs[k])
+
+    # CodingPositions.search, vectorized
+    q = sign*g
+    k = numpy.searchsorted(keys, q, side='right')-1
+    kc = numpy.maximum(k, 0)
+    inseg = q < keys[kc]+seglens[kc]
+    i = numpy.where(inseg, offs[kc]+q-keys[kc], offs[kc]+seglens[kc])
+    i = numpy.where(k < 0, 0, i)
+
+    ic = numpy.minimum(i, n-1)
+    p = _at_(ic)
+    prev = _at_(numpy.maximum(ic-1, 0))
+    d_prev = sign*(g-prev)
+    d_next = sign*(p-g)
+    exact = p == g
+    if policy == 'c_smaller':
+        smaller = numpy.ones(len(g), dtype=bool)
+    elif policy == 'c_greater':
+        smaller = numpy.zeros(len(g), dtype=bool)
+    else:
+        smaller = d_prev < d_next
+
+    cindex = numpy.where(exact | smaller, ic//3+1, (ic+1)//3+1)
+    pos = numpy.where(smaller & ~exact, ic, ic+1)
+    tpos = numpy.where(exact, 0, numpy.where(smaller, d_prev, -d_next))
+    region = numpy.where(exact, REGION_CODING, REGION_INTRONIC)
+
+    # beyond the last coding base
+    none = i >= n
+    cindex[none] = 0
+    pos[none] = 0
+    tpos[none] = 0
+    region[none] = REGION_NONE
+
+    # outside the CDS
+    last = (n+2)//3
+    before = g < t.cds_beg
+    after = g > t.cds_end
+    if sign == 1:
+        cindex[before], pos[before], region[before] = 1, 1, REGION_5PRIME
+        tpos[before] = g[before]-t.cds_beg
+        cindex[after], pos[after], region[after] = last, n, REGION_3PRIME
+        tpos[after] = g[after]-t.cds_end
+    else:
+        cindex[before], pos[before], region[before] = last, n, REGION_3PRIME
+        tpos[before] = t.cds_beg-g[before]
+        cindex[after], pos[after], region[after] = 1, 1, REGION_5PRIME
+        tpos[after] = t.cds_end-g[after]
+
+    coffset = numpy.where(pos > 0, (pos-1)%3, 0)
+    return cindex, coffset, pos, tpos, region
+
+def tnuc2gnuc_batch(t, poses, tposes=None):
+
+    """ map cDNA positions (Pos.pos, Pos.tpos) on transcript t to
+    genomic positions as tnuc2gnuc does, a numpy array when numpy is
+    available, a list otherwise. A negative Pos.pos is the end of
+    the CDS. """
+
+    cp = t.coding_positions()
+    n = len(cp)
+    if tposes is None:
+        tposes = [0]*len(poses)
+    for p in poses:
+        if p > n:
+            raise IncompatibleTranscriptError(
+                'invalid_cDNA_position_%d;expect_[0_%d]' % (p, n))
+
+    if numpy is None or n == 0:
+        return [cp[(n if p < 0 else p)-1] + cp.sign*tp
+                for p, tp in zip(poses, tposes)]
+
+    i = numpy.asarray(poses, dtype=numpy.int64)-1
+    i[i < 0] = n-1
+    offs = numpy.asarray(cp.offs, dtype=numpy.int64)
+    k = numpy.searchsorted(offs, i, side='right')-1
+    starts = numpy.asarray(cp.starts, dtype=numpy.int64)
+    return starts[k] + cp.sign*(i-offs[k]) + cp.sign*numpy.asarray(tposes, dtype=numpy.int64)
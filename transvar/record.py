@@ -27,10 +27,11 @@ SOFTWARE.
 
 """
 
-import re, sys
+import re
 from .faidx import *
 from .utils import *
 from .err import *
+from . import output
 import locale
 locale.setlocale(locale.LC_ALL, '')
 
@@ -222,10 +223,18 @@ class RegIntergenicAnno():
 
         return 'inside_[%s]' % (self.format0(),)
 
+def same_transcript(t1, t2):
+
+    """ whether t1 and t2 are the same transcript, whether or not
+    they were looked up as the same object """
+    return (t1 is t2 or
+            (t1.source, t1.name, t1.chrm, t1.beg, t1.end) ==
+            (t2.source, t2.name, t2.chrm, t2.beg, t2.end))
+
 def same_region(r1, r2):
 
     return ((r1.format() == r2.format()) and
-            ((not hasattr(r1,'t')) or (not hasattr(r2,'t')) or r1.t == r2.t))
+            ((not hasattr(r1,'t')) or (not hasattr(r2,'t')) or same_transcript(r1.t, r2.t)))
 
 class RegCDSAnno():
 
@@ -331,7 +340,8 @@ class RegSpanAnno():
         if same_region(self.b1, self.b2):
             return 'inside_[%s]' % (self.b1.format0(),)
         else:                   # large region
-            if hasattr(self.b1, 't') and hasattr(self.b2, 't') and self.b1.t == self.b2.t:
+            if (hasattr(self.b1, 't') and hasattr(self.b2, 't') and
+                same_transcript(self.b1.t, self.b2.t)):
                 s = 'from_[%s]_to_[%s]' % (self.b1.format0(), self.b2.format0())
             else:
                 s = 'from_[%s]_to_[%s]' % (self.b1.format0(with_name=True),
@@ -548,6 +558,10 @@ def normalize_reg(q):
         err_warn('region end %d negative, truncated to 0.')
         q.end = 0
 
+# when set, records are handed to record_sink(op, records) instead of
+# being printed, see api.Annotator
+record_sink = None
+
 template = "{r.tname}\t{r.gene}\t{r.strand}\t{gnuc}/{tnuc}/{taa}\t{reg}\t{r.info}"
 def print_header_s():
     return 'transcript\tgene\tstrand\tcoordinates(gDNA/cDNA/protein)\tregion\tinfo'
@@ -724,13 +738,14 @@ class Record():
     def format(self, op, args = None):
         """ This is where all the formatting actually happens """
 
+        if record_sink is not None:
+            record_sink(op, [self])
+            return
+
         s = op+'\t' if op else ''
         s += self.formats(args)
 
-        try:
-            print(s)
-        except IOError:
-            sys.exit(1)
+        output.write_line(s)
 
     def formats(self, args): # format string
 
@@ -775,14 +790,19 @@ def format_records(records, qop, args):
     This is the function all annotation will return.
     """
 
+    if record_sink is not None:
+        if len(records) == 0:
+            r = Record()
+            r.append_info('no_valid_transcript_found')
+            records = [r]
+        record_sink(qop, records)
+        return
+
     if len(records) > 0:
         if args.oneline:
             s = qop+'\t' if qop else ''
             s += '\t|||\t'.join([r.formats(args) for r in records])
-            try:
-                print(s)
-            except IOError:
-                sys.exit(1)
+            output.write_line(s)
         else:
             for r in records:
                 r.format(qop, args)
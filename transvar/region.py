@@ -423,7 +423,7 @@ def annotate_region_gdna_intergenic_span(args, q, reg):
     r.set_splice('included')
 
     if hasattr(reg.b1, 't') and hasattr(reg.b2, 't'):
-        if reg.b1.t == reg.b2.t:
+        if same_transcript(reg.b1.t, reg.b2.t):
             r.tname = reg.b1.t.format()
             r.gene = reg.b1.t.gene_name
             r.strand = reg.b1.t.strand
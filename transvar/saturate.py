@@ -0,0 +1,246 @@
+"""
+The MIT License
+
+Copyright (c) 2015
+The University of Texas MD Anderson Cancer Center
+Wanding Zhou, Tenghui Chen, Ken Chen (kchen3@mdanderson.org)
+
+Permission is hereby granted, free of charge, to any person obtaining
+a copy of this software and associated documentation files (the
+"Software"), to deal in the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+
+## saturation mutagenesis (transvar saturate)
+##
+## Enumerates every single-nucleotide substitution of a gene, a
+## transcript or a genomic region and annotates each as ganno would,
+## one output block per SNV, written as it is produced.
+##
+## A gene or transcript target covers the coding bases of its
+## transcripts and the two intronic bases on either side of each
+## coding exon (splice sites), annotated against those transcripts.
+## A region target (chr:beg-end or chr:g.beg_end) covers every base
+## of the region, annotated against all the transcripts at the site.
+##
+## Work is shared rather than repeated per SNV: the reference of the
+## target is read once, each transcript's sequence is retrieved once
+## and its sites are mapped to codons in one batch (gpos2codon_batch),
+## and the region of a site is described once for its three SNVs.
+
+import re
+from .annodb import AnnoDB
+from .record import *
+from .err import *
+from .utils import *
+from .config import read_config
+from .describe import describe, describe_genic_site
+from .snv import annotate_snv_gdna
+from .posbatch import REGION_CODING
+from . import faidx
+from . import output
+
+p_region = re.compile(r'^([^:\s]+):(?:g\.)?(\d+)(?:[-_](\d+))?$')
+
+def transcript_sites(t):
+
+    """ coding bases of t and the two intronic bases on either side
+    of each coding exon, ascending """
+    sites = set(t.coding_positions())
+    for i, (beg, end) in enumerate(t.exons):
+        if end < t.cds_beg or beg > t.cds_end:
+            continue
+        if i > 0:
+            sites.update((beg-2, beg-1))
+        if i < len(t.exons)-1:
+            sites.update((end+1, end+2))
+    return sorted(sites)
+
+class SaturationTranscript(object):
+
+    """ codon and cDNA position of the sites of one transcript, mapped
+    in one batch and built into Codon/Pos as gpos2codon does """
+
+    def __init__(self, t, sites):
+
+        self.t = t
+        t.ensure_seq()
+        sites = [g for g in sites if g >= t.beg and g <= t.end]
+        cindex, _, pos, tpos, region = t.gpos2codon_batch(sites)
+        self.index = dict(zip(sites, zip(
+            map(int, cindex), map(int, pos), map(int, tpos), map(int, region))))
+        self.np = t.coding_positions()
+
+    def codon(self, g):
+
+        """ (codon, position) of genomic site g, None if not mapped """
+        if g not in self.index:
+            return None
+        ci, pos, tpos, region = self.index[g]
+        if ci == 0:
+            return None
+        t = self.t
+        c = t._init_codon_(ci)
+        if region == REGION_CODING:
+            i = pos-1
+            c.seq = t.seq[i-i%3:i-i%3+3]
+            c.locs = self.np[i-i%3:i-i%3+3]
+            if t.strand == '-':
+                c.locs = tuple(reversed(c.locs))
+        else:
+            c.seq = t.seq[ci*3-3:ci*3]
+            c.locs = self.np[ci*3-3:ci*3]
+        return c, Pos(pos, tpos)
+
+def _tkey_(t):
+    return (t.source, t.name, t.chrm, t.beg, t.end)
+
+class Saturation(object):
+
+    """ per-transcript precomputation shared by the SNVs of a target """
+
+    def __init__(self, args, db):
+        self.args = args
+        self.db = db
+        self.tpts = {}
+
+    def prepare(self, t, sites):
+        k = _tkey_(t)
+        if k not in self.tpts:
+            try:
+                self.tpts[k] = SaturationTranscript(t, sites)
+            except SequenceRetrievalError as e:
+                err_warn(e)
+                self.tpts[k] = None
+        return self.tpts[k]
+
+    def codon(self, t, g):
+        st = self.tpts.get(_tkey_(t))
+        return None if st is None else st.codon(g)
+
+    def annotate_site(self, chrm, g, ref, regs):
+
+        """ annotate the 3 SNVs at site g, regs are the regions of g """
+        if ref not in 'ACGT':
+            return
+        sites = [(reg, self.codon(reg.t, g) if hasattr(reg, 't') else None)
+                 for reg in regs]
+        for alt in 'ACGT':
+            if alt == ref:
+                continue
+            q = QuerySNV()
+            q.tok = chrm
+            q.pos = g
+            q.ref = ref
+            q.alt = alt
+            q.op = '%s:g.%d%s>%s' % (chrm, g, ref, alt)
+            try:
+                annotate_snv_gdna(self.args, q, self.db, sites)
+            except Exception as e:
+                if self.args.verbose > 1:
+                    raise
+                wrap_exception(e, q.op, self.args)
+            output.end_query()
+
+    def saturate_region(self, chrm, beg, end):
+
+        """ every base of chrm:beg-end, against the transcripts at each site """
+        chrm = normalize_chrm(chrm)
+        refseq = faidx.refgenome.fetch_sequence(chrm, beg, end)
+        sites = list(range(beg, end+1))
+        for t in self.db.get_transcripts(chrm, beg, end):
+            self.prepare(t, sites)
+
+        for g in sites:
+            q = QuerySNV()
+            q.tok = chrm
+            q.pos = g
+            regs = list(describe(self.args, q, self.db))
+            self.annotate_site(chrm, g, refseq[g-beg], regs)
+
+    def saturate_transcripts(self, tpts):
+
+        """ coding and splice sites of tpts, against tpts """
+        chrm2sites = {}
+        for t in tpts:
+            sites = transcript_sites(t)
+            self.prepare(t, sites)
+            if t.chrm not in chrm2sites:
+                chrm2sites[t.chrm] = set()
+            chrm2sites[t.chrm].update(sites)
+
+        for chrm in sorted(chrm2sites):
+            sites = sorted(chrm2sites[chrm])
+            if not sites:
+                continue
+            refseq = faidx.refgenome.fetch_sequence(chrm, sites[0], sites[-1])
+            ctpts = [t for t in tpts if t.chrm == chrm]
+            for g in sites:
+                regs = [describe_genic_site(self.args, chrm, g, t, self.db)
+                        for t in ctpts if t.beg <= g and t.end >= g]
+                self.annotate_site(chrm, g, refseq[g-sites[0]], regs)
+
+    def saturate(self, target):
+
+        m = p_region.match(target)
+        if m:
+            beg = int(m.group(2))
+            end = int(m.group(3)) if m.group(3) else beg
+            self.saturate_region(m.group(1), beg, end)
+            return
+
+        tpts = []
+        for gene in self.db.get_gene(target.upper(), self.args.strictversion):
+            if self.args.longest:
+                tpts.append(gene.longest_tpt())
+            elif self.args.longestcoding:
+                tpts.append(gene.longest_coding_tpt())
+            else:
+                tpts.extend(gene.coding_tpts())
+        if not tpts:
+            format_records([wrap_exception(Exception('invalid_gene_%s' % target),
+                                           target, self.args)], target, self.args)
+            return
+        self.saturate_transcripts(tpts)
+
+def main_saturate(args):
+
+    config = read_config()
+    db = AnnoDB(args, config)
+
+    targets = []
+    if args.l:
+        for line in args.l:
+            fields = line.split()
+            if fields and not fields[0].startswith('#'):
+                targets.append(fields[0])
+    if args.i:
+        targets.append(args.i)
+
+    output.open_sink(args)
+    try:
+        if not args.noheader:
+            output.write_line(print_header(args))
+        for target in targets:
+            try:
+                Saturation(args, db).saturate(target)
+            except SequenceRetrievalError as e:
+                err_warn('%s: %s' % (target, e))
+    finally:
+        output.close_sink()
@@ -0,0 +1,130 @@
+"""
+The MIT License
+
+Copyright (c) 2015
+The University of Texas MD Anderson Cancer Center
+Wanding Zhou, Tenghui Chen, Ken Chen (kchen3@mdanderson.org)
+
+Permission is hereby granted, free of charge, to any person obtaining
+a copy of this software and associated documentation files (the
+"Software"), to deal in the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+
+## precomputed coding sequences (.transvardb.cds_seq)
+##
+## Written by "transvar index --cds-seq" next to the binary transcript
+## store, it holds the CDS nucleotide sequence (in the transcript
+## direction) and the protein of every transcript, keyed by the record
+## number of the transcript in .trxn_bin. Transcripts read from the
+## store slice their sequence from here instead of fetching the whole
+## genomic span from the reference and splicing it.
+##
+## A transcript whose sequence could not be retrieved, or whose CDS
+## does not translate, has no entry; the annotation then falls back to
+## the reference and raises the same error as before.
+##
+## The sequences are taken from the reference given at indexing, the
+## store has to be rebuilt when the reference changes.
+##
+## layout (little endian):
+##   header   magic, number of records and offset of the table
+##   blob     ascii sequences
+##   table    per record, offset and length of the CDS and of the
+##            protein in the blob, length -1 when absent
+
+import struct
+import mmap
+from .err import SequenceRetrievalError, IncompatibleTranscriptError
+from .transcripts import translate_seq
+
+MAGIC = b'TVCDSEQ1'
+HEADER = struct.Struct('<8sIQ')
+ENTRY = struct.Struct('<QiQi')
+
+def write_seq_store(fn, tpts):
+
+    """ tpts: transcripts in .trxn_bin order, sequences are fetched
+    from faidx.refgenome """
+
+    table = []
+    with open(fn, 'wb') as fh:
+        fh.write(HEADER.pack(MAGIC, 0, 0))
+        for t in tpts:
+            t.seq = None
+            try:
+                t.ensure_seq()
+            except SequenceRetrievalError:
+                table.append(ENTRY.pack(0, -1, 0, -1))
+                continue
+
+            nuc = t.seq.encode('ascii')
+            nuc_off = fh.tell()
+            fh.write(nuc)
+            try:
+                aa = translate_seq(t.seq).encode('ascii')
+                aa_off = fh.tell()
+                fh.write(aa)
+                aa_len = len(aa)
+            except IncompatibleTranscriptError:
+                aa_off, aa_len = 0, -1
+            table.append(ENTRY.pack(nuc_off, len(nuc), aa_off, aa_len))
+            t.seq = None        # do not hold all sequences in memory
+
+        table_off = fh.tell()
+        fh.write(b''.join(table))
+        fh.seek(0)
+        fh.write(HEADER.pack(MAGIC, len(table), table_off))
+
+class SeqStore():
+
+    """ memory-mapped reader of a .cds_seq file """
+
+    def __init__(self, fn):
+
+        self.fh = open(fn, 'rb')
+        self.mm = mmap.mmap(self.fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.nrec, self.table_off = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            raise ValueError('%s is not a coding sequence store' % fn)
+
+    def _entry_(self, rid):
+        return ENTRY.unpack_from(self.mm, self.table_off+ENTRY.size*rid)
+
+    def cds(self, rid):
+        """ CDS of record rid, None if absent """
+        off, n, _, _ = self._entry_(rid)
+        if n < 0:
+            return None
+        return self.mm[off:off+n].decode('ascii')
+
+    def protein(self, rid):
+        """ protein of record rid, None if absent """
+        _, _, off, n = self._entry_(rid)
+        if n < 0:
+            return None
+        return self.mm[off:off+n].decode('ascii')
+
+    def residue(self, rid, taa):
+        """ amino acid at 1-based protein position taa of record rid,
+        None if absent or beyond the protein """
+        _, _, off, n = self._entry_(rid)
+        if taa < 1 or taa > n:
+            return None
+        return self.mm[off+taa-1:off+taa].decode('ascii')
@@ -0,0 +1,163 @@
+"""
+The MIT License
+
+Copyright (c) 2015
+The University of Texas MD Anderson Cancer Center
+Wanding Zhou, Tenghui Chen, Ken Chen (kchen3@mdanderson.org)
+
+Permission is hereby granted, free of charge, to any person obtaining
+a copy of this software and associated documentation files (the
+"Software"), to deal in the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+
+## annotation server
+##
+## "transvar serve" loads the annotation databases and the reference
+## once and answers queries over HTTP on a local port. The path selects
+## the annotation (/ganno, /canno, /panno or /codonsearch), the queries
+## are given either as repeated "q" parameters of a GET request
+##
+##   curl 'http://localhost:8999/panno?q=PIK3CA:p.E545K&q=MET:p.1010'
+##
+## or one per line in the body of a POST request, parsed with the same
+## -d/-m/-g/... column options as a -l list. The response is the same
+## tab-delimited text the command line prints. Boolean output options
+## (noheader, oneline, aa3, gseq, haplotype) can be switched on per
+## request, e.g., "?oneline=1". Requests are served one at a time.
+
+from copy import copy
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from urlparse import urlparse, parse_qs
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from urllib.parse import urlparse, parse_qs
+
+from .annodb import AnnoDB
+from .config import read_config
+from .mutation import list_parse_mutation
+from .record import print_header
+from .err import *
+from . import anno
+from . import output
+from . import codonsearch
+
+ANNOTATIONS = ('ganno', 'canno', 'panno', 'codonsearch')
+
+# output options that can be set on a request
+REQUEST_FLAGS = ('noheader', 'oneline', 'aa3', 'gseq', 'haplotype')
+
+def annotate_lines(args, db, annotation, lines):
+
+    """ annotate a list of query lines, return the output text """
+
+    rargs = copy(args)
+    rargs.l = lines
+    rargs.vcf = None
+    rargs.skipheader = False
+    rargs.jobs = 1
+    rargs.pipeline = False
+    rargs.memo = 0
+
+    with output.capture() as buf:
+        if annotation == 'codonsearch':
+            codonsearch.main_list(rargs, db)
+        else:
+            at = annotation[0]
+            if not rargs.noheader:
+                output.write_line(print_header(rargs))
+            anno.main_list(rargs, db, at, list_parse_mutation(rargs, at))
+
+    return buf.getvalue()
+
+class TransVarRequestHandler(BaseHTTPRequestHandler):
+
+    def _respond(self, code, text):
+        body = text.encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _annotate(self, lines):
+        url = urlparse(self.path)
+        annotation = url.path.strip('/')
+        if annotation not in ANNOTATIONS:
+            self._respond(404, 'unknown annotation %s, use one of %s\n' % (
+                url.path, ', '.join('/'+a for a in ANNOTATIONS)))
+            return
+
+        params = parse_qs(url.query)
+        lines.extend(params.get('q', []))
+        lines = [line for line in lines if line.strip()]
+        if not lines:
+            self._respond(400, 'no query given\n')
+            return
+
+        args = copy(self.server.args)
+        for flag in REQUEST_FLAGS:
+            if flag in params:
+                setattr(args, flag, params[flag][-1] not in ('0', 'false'))
+
+        try:
+            text = annotate_lines(args, self.server.db, annotation, lines)
+        except Exception as e:
+            err_warn('query failed: %s' % str(e))
+            self._respond(500, 'Error=%s\n' % str(e))
+            return
+
+        self._respond(200, text)
+
+    def do_GET(self):
+        self._annotate([])
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length).decode('utf-8')
+        self._annotate(body.splitlines())
+
+    def log_message(self, format, *args):
+        if self.server.args.verbose > 0:
+            err_print('%s %s' % (self.address_string(), format % args))
+
+class TransVarServer(HTTPServer):
+
+    """ HTTP server holding a loaded AnnoDB """
+
+    def __init__(self, args, db):
+        HTTPServer.__init__(self, (args.host, args.port), TransVarRequestHandler)
+        self.args = args
+        self.db = db
+
+def main_serve(args):
+
+    config = read_config()
+    db = AnnoDB(args, config)
+
+    server = TransVarServer(args, db)
+    err_print('serving on http://%s:%d/{%s}' % (
+        args.host, args.port, ','.join(ANNOTATIONS)))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
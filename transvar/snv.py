@@ -362,7 +362,7 @@ def __core_annotate_codon_snv(args, q, db):
 ###### gDNA annotation ######
 #############################
 
-def annotate_snv_gdna(args, q, db):
+def annotate_snv_gdna(args, q, db, sites=None):
 
     """annotate gDNA SNV
 
@@ -370,6 +370,9 @@ def annotate_snv_gdna(args, q, db):
         args: (argparse.Namespace): command line arguments
         q (record.QuerySNV): query of a SNV
         db (annodb.AnnoDB): annotation database
+        sites (list of (reg, cp)): regions of q.pos with the (codon,
+            position) of their transcript (None if not known), shared
+            by the SNVs at one site; by default from describe()
 
     Returns:
         records (list of record.Record): a list of records
@@ -387,8 +390,11 @@ def annotate_snv_gdna(args, q, db):
             format_records(records, q.op, args)
             return records
 
+    if sites is None:
+        sites = [(reg, None) for reg in describe(args, q, db)]
+
     records = []
-    for reg in describe(args, q, db):
+    for reg, cp in sites:
 
         try:
             # skip if transcript ID does not match
@@ -411,7 +417,7 @@ def annotate_snv_gdna(args, q, db):
                 r.vcf_alt = r.gnuc_alt
 
             if hasattr(reg, 't'):
-                r = annotate_snv_gdna_trannscript(reg, r, q, args)
+                r = annotate_snv_gdna_trannscript(reg, r, q, args, cp)
             else:
                 r.csqn.append(r.reg.csqn()+"SNV")
 
@@ -428,7 +434,7 @@ def annotate_snv_gdna(args, q, db):
     format_records(records, q.op, args)
     return records
 
-def annotate_snv_gdna_trannscript(reg, r, q, args):
+def annotate_snv_gdna_trannscript(reg, r, q, args, cp=None):
 
     """annotate gDNA SNV at transcript region
 
@@ -437,12 +443,24 @@ def annotate_snv_gdna_trannscript(reg, r, q, args):
         q (record.QuerySNV): query of SNV
         r (record.Record): record to be updated
         args (argparse.Namespace): command line arguments
+        cp (tuple): codon and position of q.pos as from gpos2codon,
+            computed when not given
 
     Return:
         r (record.Record): record
     """
 
-    c,p = reg.t.gpos2codon(q.pos)
+    # coding SNVs of transcripts with an SNV table are read from it
+    hit = None
+    if cp is None and reg.t.snv_table is not None and q.alt:
+        hit = reg.t.snv_table.lookup(
+            reg.t, q.pos, q.alt if reg.t.strand == '+' else complement(q.alt))
+        if hit is not None:
+            cp = (hit.codon, Pos(hit.tnuc_pos, 0))
+
+    if cp is None:
+        cp = reg.t.gpos2codon(q.pos)
+    c,p = cp
 
     r.tname = reg.t.format()
     r.gene = reg.t.gene_name
@@ -473,7 +491,12 @@ def annotate_snv_gdna_trannscript(reg, r, q, args):
                     aa2 = aaf(reg.t.taa_range2aa_seq(c.index+1, c.index+args.aacontext), args)
                     r.append_info('aacontext=%s[%s]%s' % (aa1, r.taa_ref, aa2))
 
-                if q.alt:
+                if hit is not None:
+                    r.taa_alt = aaf(hit.taa_alt, args)
+                    r.csqn.append(hit.csqn)
+                    variant_protein_seq_sub(
+                        r, reg.t, args, r.taa_pos, r.taa_pos, r.taa_alt)
+                elif q.alt:
                     if c.strand == '+':
                         alt_seq = set_seq(c.seq, c.locs.index(q.pos), q.alt)
                     else:
@@ -0,0 +1,194 @@
+"""
+The MIT License
+
+Copyright (c) 2015
+The University of Texas MD Anderson Cancer Center
+Wanding Zhou, Tenghui Chen, Ken Chen (kchen3@mdanderson.org)
+
+Permission is hereby granted, free of charge, to any person obtaining
+a copy of this software and associated documentation files (the
+"Software"), to deal in the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+
+## precomputed coding SNV consequences (.transvardb.snv_tab)
+##
+## Written by "transvar index --snv-table" for the chosen transcripts,
+## it holds for every coding base and each of its three alternative
+## bases (in the transcript direction) the reference and alternative
+## codon, the reference and alternative amino acid and the consequence,
+## keyed by the record number of the transcript in .trxn_bin. A coding
+## SNV of such a transcript is then annotated by finding the cDNA
+## position of the site and reading its record, without building the
+## codon from the transcript sequence or translating it.
+##
+## Sites whose codon does not translate (e.g., a truncated last codon
+## or one with an N) are marked, and sites whose tabulated codon differs
+## from the transcript sequence are not trusted; both are annotated as
+## before.
+##
+## layout (little endian):
+##   header   magic, number of transcripts and offset of the table
+##   entries  per coding base, 3 ENTRY records for the alternative
+##            bases in ACGT order, skipping the reference base
+##   table    per transcript, offset of its first entry and number of
+##            coding bases, -1 when the transcript is not tabulated
+
+import struct
+import mmap
+from .err import SequenceRetrievalError
+from .transcripts import Codon, standard_codon_table
+
+MAGIC = b'TVSNVTB1'
+HEADER = struct.Struct('<8sIQ')
+TABLE = struct.Struct('<Qi')
+# reference codon, alternative codon, reference and alternative amino
+# acid, consequence
+ENTRY = struct.Struct('<3s3sccB')
+
+CSQN_SYNONYMOUS = 0
+CSQN_MISSENSE = 1
+CSQN_NONSENSE = 2
+CSQN_NONE = 255         # untranslatable reference codon
+CSQN_NAMES = {
+    CSQN_SYNONYMOUS: 'Synonymous',
+    CSQN_MISSENSE: 'Missense',
+    CSQN_NONSENSE: 'Nonsense',
+}
+
+BASES = 'ACGT'
+
+def _alt_index_(ref, alt):
+    """ position of alt among the alternatives of ref """
+    i = BASES.index(alt)
+    return i-1 if alt > ref else i
+
+def transcript_entries(seq):
+
+    """ ENTRY records of all coding bases of a CDS sequence, 3 per base """
+    recs = []
+    for i, ref in enumerate(seq):
+        b = i - i%3
+        codon = seq[b:b+3]
+        ref_aa = standard_codon_table.get(codon)
+        if ref_aa is None:      # also when ref is not ACGT
+            recs.extend([ENTRY.pack(b'NNN', b'NNN', b'X', b'X', CSQN_NONE)]*3)
+            continue
+        for alt in BASES:
+            if alt == ref:
+                continue
+            alt_codon = codon[:i%3] + alt + codon[i%3+1:]
+            alt_aa = standard_codon_table[alt_codon]
+            if alt_aa == ref_aa:
+                csqn = CSQN_SYNONYMOUS
+            elif alt_aa == '*':
+                csqn = CSQN_NONSENSE
+            else:
+                csqn = CSQN_MISSENSE
+            recs.append(ENTRY.pack(codon.encode('ascii'), alt_codon.encode('ascii'),
+                                   ref_aa.encode('ascii'), alt_aa.encode('ascii'), csqn))
+    return recs
+
+def write_snv_table(fn, tpts, chosen):
+
+    """ tpts: transcripts in .trxn_bin order, chosen(t) tells whether
+    t is tabulated, sequences are fetched from faidx.refgenome """
+
+    table = []
+    with open(fn, 'wb') as fh:
+        fh.write(HEADER.pack(MAGIC, 0, 0))
+        for t in tpts:
+            if not chosen(t):
+                table.append(TABLE.pack(0, -1))
+                continue
+            t.seq = None
+            try:
+                t.ensure_seq()
+            except SequenceRetrievalError:
+                table.append(TABLE.pack(0, -1))
+                continue
+            table.append(TABLE.pack(fh.tell(), len(t.seq)))
+            fh.write(b''.join(transcript_entries(t.seq)))
+            t.seq = None
+
+        table_off = fh.tell()
+        fh.write(b''.join(table))
+        fh.seek(0)
+        fh.write(HEADER.pack(MAGIC, len(table), table_off))
+
+class SNVHit(object):
+
+    """ a coding SNV read from the table """
+
+    def __init__(self, codon, tnuc_pos, alt_codon, taa_ref, taa_alt, csqn):
+        self.codon = codon
+        self.tnuc_pos = tnuc_pos
+        self.alt_codon = alt_codon
+        self.taa_ref = taa_ref
+        self.taa_alt = taa_alt
+        self.csqn = csqn
+
+class SNVTable():
+
+    """ memory-mapped reader of a .snv_tab file """
+
+    def __init__(self, fn):
+
+        self.fh = open(fn, 'rb')
+        self.mm = mmap.mmap(self.fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.nrec, self.table_off = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            raise ValueError('%s is not an SNV table' % fn)
+
+    def lookup(self, t, gpos, tnuc_alt):
+
+        """ SNVHit of the SNV of base tnuc_alt (transcript strand) at
+        genomic position gpos of transcript t, None when gpos is not a
+        tabulated coding base """
+
+        off, n = TABLE.unpack_from(self.mm, self.table_off+TABLE.size*t.rid)
+        if n < 0 or tnuc_alt not in BASES:
+            return None
+        np = t.coding_positions()
+        i = np.search(gpos)
+        if i >= len(np) or np[i] != gpos or len(np) != n:
+            return None
+
+        # the table must agree with the transcript sequence
+        t.ensure_seq()
+        codon = t.seq[i-i%3:i-i%3+3]
+        ref = codon[i%3]
+        if ref == tnuc_alt or ref not in BASES:
+            return None
+        ref_codon, alt_codon, taa_ref, taa_alt, csqn = ENTRY.unpack_from(
+            self.mm, off + ENTRY.size*(3*i+_alt_index_(ref, tnuc_alt)))
+        if csqn == CSQN_NONE or ref_codon.decode('ascii') != codon:
+            return None
+
+        c = Codon()
+        c.chrm = t.chrm
+        c.gene = t.gene
+        c.strand = t.strand
+        c.index = i//3+1
+        c.seq = codon
+        c.locs = np[i-i%3:i-i%3+3]
+        if t.strand == '-':
+            c.locs = tuple(reversed(c.locs))
+        return SNVHit(c, i+1, alt_codon.decode('ascii'), taa_ref.decode('ascii'),
+                      taa_alt.decode('ascii'), CSQN_NAMES[csqn])
@@ -0,0 +1,327 @@
+"""
+The MIT License
+
+Copyright (c) 2015
+The University of Texas MD Anderson Cancer Center
+Wanding Zhou, Tenghui Chen, Ken Chen (kchen3@mdanderson.org)
+
+Permission is hereby granted, free of charge, to any person obtaining
+a copy of this software and associated documentation files (the
+"Software"), to deal in the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+
+## SQLite transcript database (.transvardb.sqlite, --sql)
+##
+## Written by "transvar index --sql" next to the text .transvardb, the
+## one file holds everything a TransVarDB reads from its index files:
+##   genes        name, dbxref
+##   transcripts  one row per transcript, id is the .transvardb order
+##   exons        (beg, end) of each transcript, in order
+##   aliases      transcript aliases, in order
+##   idmaps       the id mappings otherwise in .<name>.idmap_idx
+##   loc          R*Tree over (chromosome, beg, end) of the transcripts
+## Name lookups go through b-tree indices, location lookups through
+## the R*Tree and the closest transcripts through (chrm, end) and
+## (chrm, beg) indices. The R*Tree stores 32-bit floats rounded
+## outwards, so its hits are refined against the exact coordinates.
+## Results come in the same order as from the tabix-indexed .loc_idx.
+## The database is opened read-only, any number of processes can read
+## it at the same time.
+
+import os
+import sqlite3
+from .transcripts import Transcript, Gene
+from .utils import normalize_chrm
+from .localdb import TransVarDB, recheck_resource
+from .tcache import canonical
+from .seqstore import SeqStore
+from .snvtable import SNVTable
+from .err import err_die
+
+try:
+    from urllib.request import pathname2url
+except ImportError:
+    from urllib import pathname2url
+
+SCHEMA = """
+CREATE TABLE genes (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    dbxref TEXT);
+CREATE TABLE chromosomes (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE);
+CREATE TABLE transcripts (
+    id INTEGER PRIMARY KEY,
+    gene_id INTEGER NOT NULL REFERENCES genes(id),
+    name TEXT,
+    version INTEGER,
+    transcript_type TEXT,
+    chrm TEXT,
+    beg INTEGER,
+    end INTEGER,
+    strand TEXT,
+    cds_beg INTEGER,
+    cds_end INTEGER);
+CREATE TABLE exons (
+    transcript_id INTEGER NOT NULL REFERENCES transcripts(id),
+    beg INTEGER,
+    end INTEGER);
+CREATE TABLE aliases (
+    transcript_id INTEGER NOT NULL REFERENCES transcripts(id),
+    alias TEXT);
+CREATE TABLE idmaps (
+    map_name TEXT,
+    key TEXT,
+    value TEXT);
+CREATE VIRTUAL TABLE loc USING rtree(id, chrm_lo, chrm_hi, beg, end);
+"""
+
+INDICES = """
+CREATE INDEX transcripts_gene ON transcripts(gene_id);
+CREATE INDEX transcripts_name ON transcripts(name);
+CREATE INDEX transcripts_end ON transcripts(chrm, end);
+CREATE INDEX transcripts_beg ON transcripts(chrm, beg);
+CREATE INDEX exons_transcript ON exons(transcript_id);
+CREATE INDEX aliases_transcript ON aliases(transcript_id);
+CREATE INDEX aliases_alias ON aliases(alias);
+CREATE INDEX idmaps_key ON idmaps(map_name, key);
+"""
+
+# a transcript row, exons and aliases are read separately
+TRANSCRIPT_COLUMNS = """
+t.id, g.name, g.dbxref, t.name, t.version, t.transcript_type, t.chrm,
+t.beg, t.end, t.strand, t.cds_beg, t.cds_end
+FROM transcripts t JOIN genes g ON g.id = t.gene_id"""
+
+# the order of .loc_idx
+LOC_ORDER = 'ORDER BY t.beg, t.end, t.name, t.id'
+
+def write_sqlite(fn, entries, idmap):
+
+    """ entries: list of (offset in .transvardb, gene name, gene dbxref,
+    transcript) in .transvardb order, idmap: {map name: {key: values}} """
+
+    tmpfn = fn+'.tmp'
+    if os.path.exists(tmpfn):
+        os.remove(tmpfn)
+    conn = sqlite3.connect(tmpfn)
+    conn.executescript(SCHEMA)
+
+    gene_ids = {}
+    chrm_ids = {}
+    for rid, (pos, gname, dbxref, t) in enumerate(entries):
+        if gname not in gene_ids:
+            gene_ids[gname] = len(gene_ids)
+            conn.execute('INSERT INTO genes VALUES (?,?,?)',
+                         (gene_ids[gname], gname, dbxref))
+        if t.chrm not in chrm_ids:
+            chrm_ids[t.chrm] = len(chrm_ids)
+            conn.execute('INSERT INTO chromosomes VALUES (?,?)',
+                         (chrm_ids[t.chrm], t.chrm))
+        conn.execute('INSERT INTO transcripts VALUES (?,?,?,?,?,?,?,?,?,?,?)',
+                     (rid, gene_ids[gname], t.name, t.version, t.transcript_type,
+                      t.chrm, t.beg, t.end, t.strand, t.cds_beg, t.cds_end))
+        conn.executemany('INSERT INTO exons VALUES (?,?,?)',
+                         [(rid, b, e) for b, e in t.exons])
+        conn.executemany('INSERT INTO aliases VALUES (?,?)',
+                         [(rid, a) for a in t.aliases])
+        c = chrm_ids[t.chrm]
+        conn.execute('INSERT INTO loc VALUES (?,?,?,?,?)', (rid, c, c, t.beg, t.end))
+
+    for map_name, mapping in idmap.items():
+        conn.executemany('INSERT INTO idmaps VALUES (?,?,?)',
+                         [(map_name, k, v) for k, vs in mapping.items() for v in vs])
+
+    conn.executescript(INDICES)
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.close()
+    os.rename(tmpfn, fn)
+
+def connect_readonly(fn):
+
+    try:
+        return sqlite3.connect('file:%s?mode=ro' % pathname2url(os.path.abspath(fn)),
+                               uri=True, check_same_thread=False)
+    except TypeError:           # python 2, no uri
+        return sqlite3.connect(fn, check_same_thread=False)
+
+class SQLIdMap():
+
+    """ an id mapping read from the idmaps table on demand,
+    used in place of the unpickled dictionary """
+
+    def __init__(self, conn, map_name):
+        self.conn = conn
+        self.map_name = map_name
+        self.cache = {}
+
+    def __len__(self):
+        return self.conn.execute('SELECT COUNT(*) FROM idmaps WHERE map_name=?',
+                                 (self.map_name,)).fetchone()[0]
+
+    def __getitem__(self, key):
+        if key not in self.cache:
+            self.cache[key] = [v for v, in self.conn.execute(
+                'SELECT value FROM idmaps WHERE map_name=? AND key=? ORDER BY rowid',
+                (self.map_name, key))]
+        if not self.cache[key]:
+            raise KeyError(key)
+        return self.cache[key]
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+class SQLTransVarDB(TransVarDB):
+
+    """ TransVarDB answered from the SQLite database written by
+    transvar index --sql, only the .sqlite file (and the optional
+    .cds_seq and .snv_tab) is read """
+
+    def __init__(self, dbfn=None, source=None):
+
+        self.name2gene = {}
+        self.idmap = {}
+        if dbfn is None: return
+        dbfn = recheck_resource(dbfn)
+
+        self.dbfn = dbfn
+        self.sqlfn = dbfn+'.sqlite'
+        if not os.path.exists(self.sqlfn):
+            err_die("Missing SQLite database %s. Consider rerunning the transvar index command with --sql" % self.sqlfn)
+        self.conn = connect_readonly(self.sqlfn)
+
+        self.store = None
+        self.near_idx = None
+        self.seq_store = None
+        if os.path.exists(dbfn+'.cds_seq'):
+            self.seq_store = SeqStore(dbfn+'.cds_seq')
+        self.snv_table = None
+        if os.path.exists(dbfn+'.snv_tab'):
+            self.snv_table = SNVTable(dbfn+'.snv_tab')
+        self.alias_idx = None
+        self.loc_idx = None
+        self.mem_loc = None     # set by parse_all
+        self.source = source
+
+    def has_idmap(self, map_name):
+        return self.conn.execute('SELECT 1 FROM idmaps WHERE map_name=? LIMIT 1',
+                                 (map_name,)).fetchone() is not None
+
+    def load_idmap(self, map_name):
+        return SQLIdMap(self.conn, map_name)
+
+    def _transcripts_(self, where, params=()):
+
+        """ transcripts of a query on TRANSCRIPT_COLUMNS, in its order """
+        rows = self.conn.execute('SELECT %s %s' % (TRANSCRIPT_COLUMNS, where), params).fetchall()
+        return [canonical(self._transcript_(row)) for row in rows]
+
+    def _transcript_(self, row):
+
+        (rid, gname, dbxref, name, version, ttype, chrm,
+         beg, end, strand, cds_beg, cds_end) = row
+        t = Transcript()
+        t.gene_name = gname
+        t.name = name
+        t.version = version
+        t.transcript_type = ttype
+        t.beg = beg
+        t.end = end
+        t.chrm = chrm
+        t.strand = strand
+        t.cds_beg = cds_beg
+        t.cds_end = cds_end
+        t.exons = [(b, e) for b, e in self.conn.execute(
+            'SELECT beg, end FROM exons WHERE transcript_id=? ORDER BY rowid', (rid,))]
+        aliases = [a for a, in self.conn.execute(
+            'SELECT alias FROM aliases WHERE transcript_id=? ORDER BY rowid', (rid,))]
+        if aliases:
+            t.aliases = aliases
+        t.gene_dbxref = dbxref
+        t.source = self.source
+        t.rid = rid
+        t.seq_store = self.seq_store
+        t.snv_table = self.snv_table
+        return t
+
+    def all_transcripts(self):
+        return self._transcripts_('ORDER BY t.id')
+
+    def gene_transcripts(self, name):
+        if self.mem_loc is not None:
+            return TransVarDB.gene_transcripts(self, name)
+        return self._transcripts_('WHERE g.name=? ORDER BY t.id', (name,)) or None
+
+    def trnx_transcripts(self, name):
+        if self.mem_loc is not None:
+            return TransVarDB.trnx_transcripts(self, name)
+        return self._transcripts_('WHERE t.name=? ORDER BY t.id', (name,)) or None
+
+    def get_by_alias(self, alias):
+
+        """ read a gene by alias of transcripts """
+        name2gene = {}
+        genes = []
+        for t in self._transcripts_(
+                'WHERE t.id IN (SELECT transcript_id FROM aliases WHERE alias=?) ORDER BY t.id',
+                (alias,)):
+            if t.gene_name not in name2gene:
+                name2gene[t.gene_name] = Gene(t.gene_name)
+                genes.append(name2gene[t.gene_name])
+            name2gene[t.gene_name].link_t(t)
+        return iter(genes)
+
+    def loc_transcripts(self, chrm, beg, end):
+
+        """ transcripts overlapping [beg, end], tabix semantics """
+        if self.mem_loc is not None:
+            return TransVarDB.loc_transcripts(self, chrm, beg, end)
+        beg = max(0, beg)
+        if end <= max(0, beg-1):    # empty region for tabix
+            return []
+        row = self.conn.execute('SELECT id FROM chromosomes WHERE name=?', (chrm,)).fetchone()
+        if row is None:
+            return []
+        return self._transcripts_(
+            'JOIN loc r ON r.id = t.id '
+            'WHERE r.chrm_lo <= ?1 AND r.chrm_hi >= ?1 AND r.beg < ?2 AND r.end >= ?3 '
+            'AND t.beg < ?2 AND t.end >= ?3 ' + LOC_ORDER, (row[0], end, beg))
+
+    def get_closest_upstream(self, chrm, pos):
+        if self.mem_loc is not None:
+            return TransVarDB.get_closest_upstream(self, chrm, pos)
+        tpts = self._transcripts_(
+            'WHERE t.chrm=? AND t.end<? ORDER BY t.end DESC, t.beg, t.name, t.id LIMIT 1',
+            (normalize_chrm(chrm), int(pos)))
+        return tpts[0] if tpts else None
+
+    def get_closest_downstream(self, chrm, pos):
+        if self.mem_loc is not None:
+            return TransVarDB.get_closest_downstream(self, chrm, pos)
+        tpts = self._transcripts_(
+            'WHERE t.chrm=? AND t.beg>? ORDER BY t.beg, t.end, t.name, t.id LIMIT 1',
+            (normalize_chrm(chrm), int(pos)))
+        return tpts[0] if tpts else None
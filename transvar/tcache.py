@@ -0,0 +1,106 @@
+"""
+The MIT License
+
+Copyright (c) 2015
+The University of Texas MD Anderson Cancer Center
+Wanding Zhou, Tenghui Chen, Ken Chen (kchen3@mdanderson.org)
+
+Permission is hereby granted, free of charge, to any person obtaining
+a copy of this software and associated documentation files (the
+"Software"), to deal in the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+
+## canonical transcript objects
+##
+## Every lookup in a TransVarDB decodes a new Transcript, so the
+## coding sequence (ensure_seq) and the position array of a transcript
+## used to be recomputed for each variant that touches it. The cache
+## maps (source, name, chromosome, begin) to one canonical object per
+## process, and whatever was materialized on that object is kept.
+## Entries are evicted least recently used once their estimated size
+## exceeds the budget (--transcript-cache, in MB). Sizes are measured
+## again when an entry is reused, since seq is only filled in after
+## the transcript was first returned.
+
+from collections import OrderedDict
+from .err import err_print
+
+def transcript_size(t):
+
+    """ rough number of bytes held by a transcript """
+    size = 1024 + 64*len(t.exons)
+    if t.seq:
+        size += len(t.seq)
+    return size
+
+class TranscriptCache(object):
+
+    def __init__(self, maxbytes):
+        self.maxbytes = maxbytes
+        self.cache = OrderedDict()
+        self.sizes = {}
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def canonical(self, t):
+
+        """ the cached transcript equal to t, t itself if new """
+        key = (t.source, t.name, t.chrm, t.beg)
+        t0 = self.cache.pop(key, None)
+        if t0 is not None:
+            self.nbytes -= self.sizes.pop(key)
+        if (t0 is not None and t0.end == t.end and
+            t0.version == t.version and t0.exons == t.exons):
+            self.hits += 1
+            t = t0
+        else:                   # new, or a different transcript under the key
+            self.misses += 1
+
+        self.cache[key] = t     # most recently used
+        self.sizes[key] = transcript_size(t)
+        self.nbytes += self.sizes[key]
+        while self.nbytes > self.maxbytes and len(self.cache) > 1:
+            k, _ = self.cache.popitem(last=False)
+            self.nbytes -= self.sizes.pop(k)
+            self.evictions += 1
+        return t
+
+# per-process cache, None when disabled
+cache = None
+
+def init(maxbytes):
+    global cache
+    cache = TranscriptCache(maxbytes) if maxbytes > 0 else None
+
+def canonical(t):
+    if cache is None:
+        return t
+    return cache.canonical(t)
+
+def report():
+
+    """ print the hit rate and evictions """
+    if cache is None or cache.hits + cache.misses == 0:
+        return
+    err_print('transcript cache: %d of %d lookups reused (%1.1f%% hit rate), %d evicted, %1.1f MB held' % (
+        cache.hits, cache.hits+cache.misses, 100.0*cache.hits/(cache.hits+cache.misses),
+        cache.evictions, cache.nbytes/1048576.0))
@@ -29,9 +29,15 @@ SOFTWARE.
 from __future__ import division
 import sys, re
 from . import faidx
+from . import posbatch
 from .record import *
 from .utils import *
 from collections import deque
+from bisect import bisect_right
+try:
+    import numpy
+except ImportError:
+    numpy = None
 import operator
 from functools import reduce
 
@@ -244,6 +250,89 @@ def psort(a,b):
     else:
         return a,b
 
+class CodingPositions(object):
+
+    """ genomic position of each coding base of a transcript, in
+    transcript order. It behaves like the list from position_array()
+    (len, indexing, slicing) but keeps one entry per coding segment of
+    an exon and maps an index through the cumulative segment offsets,
+    so memory is O(exons) and a lookup O(log exons).
+    """
+
+    def __init__(self, t):
+
+        # positions run up on '+' and down on '-', sign*position
+        # increases along the transcript
+        self.sign = 1 if t.strand == '+' else -1
+        self.starts = []        # genomic position of a segment's first base
+        self.offs = []          # index of a segment's first base
+        self.exinds = []        # exon number (in transcript order)
+        n = 0
+        exons = t.exons if t.strand == '+' else reversed(t.exons)
+        for i, (beg, end) in enumerate(exons):
+            b = max(beg, t.cds_beg)
+            e = min(t.cds_end, end)
+            if b > e:
+                continue
+            self.starts.append(b if self.sign == 1 else e)
+            self.offs.append(n)
+            self.exinds.append(i+1)
+            n += e-b+1
+        self.n = n
+
+        # searching needs segments that do not overlap and follow
+        # the transcript direction, i.e., sorted exons
+        self.keys = [self.sign*p for p in self.starts]
+        self.ordered = all(self.keys[k]+self.offs[k+1]-self.offs[k] <= self.keys[k+1]
+                          for k in range(len(self.keys)-1))
+
+    def __len__(self):
+        return self.n
+
+    def _segment_(self, i):
+        return bisect_right(self.offs, i)-1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self.n))]
+        if i < 0:
+            i += self.n
+        if i < 0 or i >= self.n:
+            raise IndexError('coding position out of range')
+        k = self._segment_(i)
+        return self.starts[k] + self.sign*(i-self.offs[k])
+
+    def __iter__(self):
+        for i in range(self.n):
+            yield self[i]
+
+    def search(self, gpos):
+
+        """ index of the first base at or beyond gpos in transcript
+        direction (>= gpos on '+', <= gpos on '-'), len(self) if none """
+        if not self.ordered:
+            for i, pos in enumerate(self):
+                if self.sign*pos >= self.sign*gpos:
+                    return i
+            return self.n
+
+        q = self.sign*gpos
+        k = bisect_right(self.keys, q)-1
+        if k < 0:
+            return 0
+        seglen = (self.offs[k+1] if k+1 < len(self.offs) else self.n) - self.offs[k]
+        if q < self.keys[k]+seglen:
+            return self.offs[k]+q-self.keys[k]
+        return self.offs[k]+seglen
+
+    def exon_inds(self, beg, end):
+
+        """ sorted exon numbers of the bases in the slice [beg:end] """
+        r = range(*slice(beg, end).indices(self.n))
+        if len(r) == 0:
+            return []
+        return self.exinds[self._segment_(r[0]):self._segment_(r[-1])+1]
+
 def tnuc_range2gnuc_range_(np, tbeg, tend):
 
     """convert transcript range to genomic range
@@ -271,6 +360,9 @@ class Transcript():
         self.aliases = []
         self.version = 255
         self.source = ''
+        self.rid = None         # record number in the transcript store
+        self.seq_store = None   # precomputed sequences (.cds_seq)
+        self.snv_table = None   # precomputed coding SNVs (.snv_tab)
 
     def __lt__(self, other):
         return self.name < other.name
@@ -315,6 +407,10 @@ class Transcript():
         return self.seq[beg-1:end]
 
     def get_proteinseq(self):
+        if self.seq_store is not None:
+            aa = self.seq_store.protein(self.rid)
+            if aa is not None:
+                return aa
         self.ensure_seq()
         return translate_seq(self.seq)
 
@@ -359,6 +455,11 @@ class Transcript():
         potential reason include patch chromosomes
         """
         if self.seq: return
+        if self.seq_store is not None:
+            seq = self.seq_store.cds(self.rid)
+            if seq is not None:
+                self.seq = seq
+                return
         if not faidx.refgenome:
             err_die("please provide reference through --ref [reference fasta].")
 
@@ -386,34 +487,28 @@ class Transcript():
         return self == self.gene.std_tpt
 
     def position_array(self):
-        if self.strand == "+":
-            np = []
-            for beg, end in self.exons:
-                np += list(range(max(beg, self.cds_beg),
-                            min(self.cds_end, end)+1))
-        else:
-            np = []
-            for beg, end in reversed(self.exons):
-                np += list(range(min(self.cds_end, end),
-                            max(beg, self.cds_beg)-1,-1))
+        return list(CodingPositions(self))
 
-        return np
+    def coding_positions(self):
+        if hasattr(self, 'np'):
+            return self.np
+        return CodingPositions(self)
 
     def tnuc_range2gnuc_range(self, tbeg, tend):
 
         """ convert transcript range to genomic range
         tbeg and tend are 1-based
         """
-        np = self.position_array()
-        # print self.
-        # print len(np)
-        # print tbeg, tend
-        return tnuc_range2gnuc_range_(np, tbeg, tend)
+        return tnuc_range2gnuc_range_(self.coding_positions(), tbeg, tend)
 
     def taa2aa(self, taa):
         self.ensure_seq()
         if taa*3 > self.cdslen():
             raise IncompatibleTranscriptError('invalid_reference_protein_position_%d;expect_[0_%d]' % (taa, self.cdslen()//3))
+        if self.seq_store is not None:
+            aa = self.seq_store.residue(self.rid, taa)
+            if aa is not None:
+                return aa
         return codon2aa(self.seq[taa*3-3:taa*3])
 
     def taa_range2tnuc_seq(self, taa_beg, taa_end):
@@ -478,15 +573,7 @@ class Transcript():
 
     def _tnuc_range2exon_inds(self, tnuc_beg, tnuc_end):
 
-        exoninds = []
-        if self.strand == '+':
-            for i, (beg, end) in enumerate(self.exons):
-                exoninds.extend([i+1]*(min(self.cds_end, end)-max(beg, self.cds_beg)+1))
-        else:
-            for i, (beg, end) in enumerate(reversed(self.exons)):
-                exoninds.extend([i+1]*(min(self.cds_end, end)-max(beg, self.cds_beg)+1))
-
-        return sorted(list(set(exoninds[tnuc_beg-1:tnuc_end])))
+        return self.coding_positions().exon_inds(tnuc_beg-1, tnuc_end)
 
 
     def tnuc_range2exon_inds(self, tnuc_beg, tnuc_end):
@@ -512,44 +599,24 @@ class Transcript():
         """
         self.ensure_seq()
         cpos = int(cpos)
+        np = self.coding_positions()
+        assert len(np) == len(self.seq)
+
+        ni = cpos*3
+        if ni > len(np):
+            raise IncompatibleTranscriptError('invalid_cDNA_position_%d;expect_[0_%d]' % (ni, len(np)))
+
+        codon        = Codon()
+        codon.index  = cpos
         if self.strand == "+":
-            np = []
-            for beg, end in self.exons:
-                np += list(range(max(beg, self.cds_beg),
-                            min(self.cds_end, end)+1))
-            assert len(np) == len(self.seq)
-
-            ni = cpos*3
-            if ni <= len(np):
-                codon        = Codon()
-                codon.index  = cpos
-                codon.locs   = tuple(np[ni-3:ni])
-                codon.gene   = self.gene
-                codon.chrm   = self.chrm
-                codon.strand = self.strand
-                codon.seq    = self.seq[ni-3:ni]
-                return codon
-            else:
-                raise IncompatibleTranscriptError('invalid_cDNA_position_%d;expect_[0_%d]' % (ni, len(np)))
+            codon.locs = tuple(np[ni-3:ni])
         else:
-            np = []
-            for beg, end in reversed(self.exons):
-                np += list(range(min(self.cds_end, end),
-                            max(beg, self.cds_beg)-1,-1))
-            assert len(np) == len(self.seq)
-
-            ni = cpos*3
-            if ni <= len(np):
-                codon        = Codon()
-                codon.index  = cpos
-                codon.locs   = tuple(reversed(np[ni-3:ni]))
-                codon.gene   = self.gene
-                codon.chrm   = self.chrm
-                codon.strand = self.strand
-                codon.seq    = self.seq[ni-3:ni]
-                return codon
-            else:
-                raise IncompatibleTranscriptError('invalid_cDNA_position_%d;expect_[0_%d]' % (ni, len(np)))
+            codon.locs = tuple(reversed(np[ni-3:ni]))
+        codon.gene   = self.gene
+        codon.chrm   = self.chrm
+        codon.strand = self.strand
+        codon.seq    = self.seq[ni-3:ni]
+        return codon
 
     def _init_codon_(self, index):
         c = Codon()
@@ -669,7 +736,9 @@ class Transcript():
             c.locs = np[c.index*3-3:c.index*3]
             return c, p
 
-        for i, pos in enumerate(np):
+        i = np.search(gpos)
+        if i < len(np):
+            pos = np[i]
             if gpos == pos:
                 c = self._init_codon_(i//3+1)
                 c.seq    = self.seq[i-i%3:i-i%3+3]
@@ -714,7 +783,9 @@ class Transcript():
             c.locs = np[:3]
             return c, p
 
-        for i, pos in enumerate(np):
+        i = np.search(gpos)
+        if i < len(np):
+            pos = np[i]
             if gpos == pos:
                 c = self._init_codon_(i//3+1)
                 c.seq = self.seq[i-i%3:i-i%3+3]
@@ -749,7 +820,7 @@ class Transcript():
         if hasattr(self, 'np'):
             return
         self.ensure_seq()
-        self.np = self.position_array()
+        self.np = CodingPositions(self)
         assert len(self.np) == len(self.seq)
         return
 
@@ -801,6 +872,18 @@ class Transcript():
         else:
             return self._gpos2codon_n(gpos, self.np, intronic_policy)
 
+    def gpos2codon_batch(self, gposes, intronic_policy='closer'):
+
+        """ gpos2codon of many genomic positions in one call
+        return arrays of codon index, within-codon offset, cDNA position,
+        intronic offset and region class (see posbatch) """
+        return posbatch.gpos2codon_batch(self, gposes, intronic_policy)
+
+    def tnuc2gnuc_batch(self, poses, tposes=None):
+
+        """ tnuc2gnuc of many cDNA positions (pos and tpos arrays) """
+        return posbatch.tnuc2gnuc_batch(self, poses, tposes)
+
     def intronic_lean(self, p, direc):
 
         self.ensure_position_array()
@@ -1043,46 +1126,65 @@ class Transcript():
     def extend_taa_seq(self, taa_pos_base, old_seq, new_seq):
         """
         this function also returns the extended sequence itself
+        codons are translated a window at a time up to the first stop
+        codon of new_seq, the window grows while no stop is found and
+        the sequences are extended from the reference at a codon that
+        is incomplete or untranslatable
         """
         taa_pos = None
         termlen = -1 # use -1 to detect abnormal computes
         seq_end = self.cds_end
-        new_aa_seq = ''
+        new_aa_seqs = []
         i = 0
+        w = 8
         while True:
-            ci = i*3
-            old_codon_seq = old_seq[ci:ci+3]
-            new_codon_seq = new_seq[ci:ci+3]
-            # if sequence comes to ends, extend sequence from reference file
-            if (old_codon_seq not in standard_codon_table or
-                new_codon_seq not in standard_codon_table):
-                seq_inc = faidx.refgenome.fetch_sequence(self.chrm, seq_end+1, seq_end+100)
-                old_seq += seq_inc
-                new_seq += seq_inc
-                old_codon_seq = old_seq[ci:ci+3]
-                new_codon_seq = new_seq[ci:ci+3]
-                seq_end += 100
-
-            taa_ref_run = codon2aa(old_codon_seq)
-            taa_alt_run = codon2aa(new_codon_seq)
-            new_aa_seq += taa_alt_run
-            # print i, old_codon_seq, new_codon_seq, taa_ref_run, taa_alt_run
-            if taa_pos == None and taa_ref_run != taa_alt_run:
-                taa_pos = i
-                taa_ref = taa_ref_run
-                taa_alt = taa_alt_run
-            if taa_alt_run == '*':
+            # codons i..i+n-1 translate in both sequences, old_seq
+            # is only checked beyond the first difference
+            new_aa_seq = translate_codons(new_seq[i*3:(i+w)*3])
+            n = min(len(new_aa_seq), len(old_seq)//3-i)
+            if taa_pos == None:
+                old_aa_seq = translate_codons(old_seq[i*3:(i+n)*3])
+                bad = old_aa_seq.find('?')
+            else:
+                m = _p_nonbase.search(old_seq, i*3, (i+n)*3)
+                bad = (m.start()-i*3)//3 if m else -1
+            if bad >= 0:
+                n = bad
+            bad = new_aa_seq.find('?', 0, n)
+            if bad >= 0:
+                n = bad
+
+            stop = new_aa_seq.find('*', 0, n)
+            last = stop+1 if stop >= 0 else n
+            if taa_pos == None:
+                for j in range(last):
+                    if old_aa_seq[j] != new_aa_seq[j]:
+                        taa_pos = i+j
+                        taa_ref = old_aa_seq[j]
+                        taa_alt = new_aa_seq[j]
+                        break
+            new_aa_seqs.append(new_aa_seq[:last])
+            if stop >= 0:
                 if taa_pos == None:
                     # stop codon encountered before difference
                     return None  # nothing occur to protein level
-                termlen = i + 1 - taa_pos
+                termlen = i + stop + 1 - taa_pos
                 break
-            i += 1
 
-        new_aa_seq = new_aa_seq[taa_pos:]
-        if taa_pos == None:
-            print('oldseq', old_seq)
-            print('newseq', new_seq)
+            i += n
+            if n == w:
+                w *= 2
+                continue
+
+            # if sequence comes to ends, extend sequence from reference file
+            seq_inc = faidx.refgenome.fetch_sequence(self.chrm, seq_end+1, seq_end+100)
+            old_seq += seq_inc
+            new_seq += seq_inc
+            seq_end += 100
+            codon2aa(old_seq[i*3:i*3+3])
+            codon2aa(new_seq[i*3:i*3+3])
+
+        new_aa_seq = ''.join(new_aa_seqs)[taa_pos:]
         taa_pos += taa_pos_base
 
         aae = AAExtension()
@@ -1283,19 +1385,51 @@ class Gene():
         else:
             return self.longest_tpt().end
 
+# codons as 2-bit codes, 4 for anything but (upper-case) ACGT, and
+# the amino acid of each code, '?' for an untranslatable codon
+_base_codes = bytearray([4]*256)
+for _i, _b in enumerate('ACGT'):
+    _base_codes[ord(_b)] = _i
+_base_codes = bytes(_base_codes)
+_code_aas = ''.join([standard_codon_table[a+b+c]
+                     for a in 'ACGT' for b in 'ACGT' for c in 'ACGT']) + '?'
+if numpy is not None:
+    _code_aas_array = numpy.frombuffer(_code_aas.encode('ascii'), dtype=numpy.uint8)
+
+_p_nonbase = re.compile(r'[^ACGT]')
+
+def translate_codons(seq):
+
+    """ amino acids of all the complete codons of seq, in one pass,
+    '?' for a codon that is not in the standard table """
+    n = len(seq)//3
+    if numpy is None or n < 64:
+        try:
+            return ''.join([standard_codon_table[seq[i:i+3]] for i in range(0, n*3, 3)])
+        except KeyError:
+            return ''.join([standard_codon_table.get(seq[i:i+3], '?')
+                            for i in range(0, n*3, 3)])
+
+    codes = numpy.frombuffer(seq[:n*3].encode('ascii').translate(_base_codes),
+                             dtype=numpy.uint8).reshape(n, 3).astype(numpy.intp)
+    inds = codes[:,0]*16 + codes[:,1]*4 + codes[:,2]
+    inds[(codes == 4).any(axis=1)] = 64
+    return _code_aas_array[inds].tobytes().decode('ascii')
+
 def translate_seq(seq):
 
     if len(seq) % 3 != 0:
         raise IncompatibleTranscriptError('coding_sequence_not_multiplicative_of_3;length_%d' % len(seq))
 
-    aa_seq = []
-    for i in range(len(seq)//3):
-        aa = codon2aa(seq[i*3:i*3+3])
-        aa_seq.append(aa)
-        if aa == '*':
-            break
+    aa_seq = translate_codons(seq)
+    stop = aa_seq.find('*')
+    if stop >= 0:
+        aa_seq = aa_seq[:stop+1]
+    bad = aa_seq.find('?')
+    if bad >= 0:
+        raise IncompatibleTranscriptError('Invalid_codon_sequence_%s' % seq[bad*3:bad*3+3])
 
-    return ''.join(aa_seq)
+    return aa_seq
 
 class Region():
 
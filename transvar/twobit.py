@@ -0,0 +1,205 @@
+"""
+The MIT License
+
+Copyright (c) 2015
+The University of Texas MD Anderson Cancer Center
+Wanding Zhou, Tenghui Chen, Ken Chen (kchen3@mdanderson.org)
+
+Permission is hereby granted, free of charge, to any person obtaining
+a copy of this software and associated documentation files (the
+"Software"), to deal in the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+
+## 2-bit packed reference (<reference>.tv2bit)
+##
+## Written by "transvar index --reference <fasta> --twobit", it holds
+## the upper-cased reference with four bases per byte, a quarter of
+## the FASTA, so worker processes share a much smaller mapped file.
+## Bases other than A, C, G and T (N and the IUPAC codes) are kept as
+## runs of one character and patched back in when a window is read.
+## RefGenome reads from it in place of the FASTA when it is present
+## and not older than the FASTA.
+##
+## layout (little endian):
+##   header    magic, number of chromosomes
+##   per chromosome: name length, name, length, offset of the packed
+##             bases, offset of the runs, number of runs
+##   packed    2 bits per base, A=0, C=1, G=2, T=3, the first base in
+##             the highest bits
+##   runs      uint32 starts (0-based), uint32 lengths, one byte each
+
+import os
+import re
+import struct
+import mmap
+from array import array
+from binascii import hexlify, unhexlify
+from bisect import bisect_right
+from .err import err_print
+
+MAGIC = b'TVREF2B1'
+HEADER = struct.Struct('<8sI')
+ENTRY = struct.Struct('<QQQI')
+CHUNK = 1<<22                   # bases packed at a time, a multiple of 4
+
+_code_ = bytearray(256)         # anything else is packed as A
+for i, b in enumerate(bytearray(b'ACGT')):
+    _code_[b] = i
+CODE_TABLE = bytes(_code_)
+BASE_TABLE = b'ACGT' + b'\0'*252
+p_runs = re.compile(br'([^ACGT])\1*')
+
+# int.from_bytes, int.to_bytes, array.frombytes and array.tobytes
+# are Python 3 only
+def _bytes2int_(b):
+    if hasattr(int, 'from_bytes'):
+        return int.from_bytes(b, 'big')
+    return int(hexlify(b) or b'0', 16)
+
+def _int2bytes_(v, n):
+    if hasattr(int, 'to_bytes'):
+        return v.to_bytes(n, 'big')
+    return unhexlify('%0*x' % (2*n, v)) if n > 0 else b''
+
+def _uint32_array_(b):
+    a = array('I')
+    if hasattr(a, 'frombytes'):
+        a.frombytes(b)
+    else:
+        a.fromstring(b)
+    return a
+
+def _array_bytes_(a):
+    if hasattr(a, 'tobytes'):
+        return a.tobytes()
+    return a.tostring()
+
+def pack_bases(seq):
+
+    """ pack upper-case bases, four per byte; the bytes are combined
+    as big integers so no Python loop runs over the bases """
+    codes = seq.translate(CODE_TABLE)
+    codes += b'\0' * (-len(codes) % 4)
+    n = len(codes)//4
+    v = 0
+    for k in range(4):
+        v = (v<<2) | _bytes2int_(codes[k::4])
+    return _int2bytes_(v, n)
+
+def unpack_bases(packed):
+
+    """ upper-case bases of packed bytes, four per byte """
+    n = len(packed)
+    v = _bytes2int_(packed)
+    mask = _bytes2int_(b'\3'*n)
+    out = bytearray(4*n)
+    for k in range(4):
+        out[k::4] = _int2bytes_((v >> (6-2*k)) & mask, n)
+    return bytes(out).translate(BASE_TABLE)
+
+def write_twobit(refgenome, fn):
+
+    """ pack the chromosomes of a RefGenome into fn """
+    chrms = sorted(refgenome.faidx.items(), key=lambda x: x[1][1])  # file order
+    names = [c.encode('utf-8') for c, entry in chrms]
+    header_size = HEADER.size + sum(4+len(nm)+ENTRY.size for nm in names)
+
+    tmpfn = fn+'.tmp'
+    with open(tmpfn, 'wb') as fh:
+        fh.write(b'\0'*header_size)
+        entries = []
+        for (c, (slen, offset, blen, bytelen)) in chrms:
+            packed_off = fh.tell()
+            starts = array('I')
+            lengths = array('I')
+            chars = bytearray()
+            for beg in range(0, slen, CHUNK):
+                seq = refgenome.fetch_sequence_bytes(c, beg+1, min(beg+CHUNK, slen))
+                fh.write(pack_bases(seq))
+                for m in p_runs.finditer(seq):
+                    s, e = beg+m.start(), beg+m.end()
+                    if (chars and chars[-1:] == m.group(1) and
+                        starts[-1]+lengths[-1] == s): # run across chunks
+                        lengths[-1] += e-s
+                    else:
+                        starts.append(s)
+                        lengths.append(e-s)
+                        chars += m.group(1)
+            runs_off = fh.tell()
+            fh.write(_array_bytes_(starts))
+            fh.write(_array_bytes_(lengths))
+            fh.write(bytes(chars))
+            entries.append((slen, packed_off, runs_off, len(starts)))
+
+        fh.seek(0)
+        fh.write(HEADER.pack(MAGIC, len(chrms)))
+        for nm, entry in zip(names, entries):
+            fh.write(struct.pack('<I', len(nm)) + nm + ENTRY.pack(*entry))
+    os.rename(tmpfn, fn)
+    err_print("packed %d chromosomes into %s" % (len(chrms), fn))
+
+class TwoBitGenome():
+
+    """ read windows of the packed reference """
+
+    def __init__(self, fn):
+
+        with open(fn, 'rb') as fh:
+            self.mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, nchrm = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            raise ValueError('%s is not a packed reference' % fn)
+        self.chrms = {}
+        self.runs = {}          # loaded on first use
+        off = HEADER.size
+        for i in range(nchrm):
+            nlen, = struct.unpack_from('<I', self.mm, off)
+            name = self.mm[off+4:off+4+nlen].decode('utf-8')
+            self.chrms[name] = ENTRY.unpack_from(self.mm, off+4+nlen)
+            off += 4+nlen+ENTRY.size
+
+    def _runs_(self, chrom):
+
+        if chrom not in self.runs:
+            slen, packed_off, runs_off, nruns = self.chrms[chrom]
+            starts = _uint32_array_(self.mm[runs_off:runs_off+4*nruns])
+            lengths = _uint32_array_(self.mm[runs_off+4*nruns:runs_off+8*nruns])
+            chars = self.mm[runs_off+8*nruns:runs_off+9*nruns]
+            self.runs[chrom] = (starts, lengths, chars)
+        return self.runs[chrom]
+
+    def fetch(self, chrom, start, end):
+
+        """ upper-case bytes of the 0-based half-open window [start, end) """
+        slen, packed_off, runs_off, nruns = self.chrms[chrom]
+        b = start//4
+        seq = unpack_bases(self.mm[packed_off+b:packed_off+(end+3)//4])
+        seq = bytearray(seq[start-4*b:end-4*b])
+
+        if nruns > 0:
+            starts, lengths, chars = self._runs_(chrom)
+            i = max(0, bisect_right(starts, start)-1)
+            while i < nruns and starts[i] < end:
+                s = max(starts[i], start)
+                e = min(starts[i]+lengths[i], end)
+                if s < e:
+                    seq[s-start:e-start] = chars[i:i+1]*(e-s)
+                i += 1
+        return bytes(seq)